@@ -0,0 +1,5 @@
+"""Performance benchmarks for jma-client.
+
+Run with:
+    python -m benchmarks.run
+"""
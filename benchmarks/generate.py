@@ -0,0 +1,76 @@
+"""Generator of synthetic obsdl CSV payloads.
+
+The payloads mimic what table.html returns: a download timestamp preamble, multi-line
+headers (station names, element names and, with lta, a 平年値 line), CRLF line endings,
+blank cells for missing daily values, '--' for missing hourly values, and cp932 encoding.
+"""
+from datetime import date, timedelta
+import math
+import random
+
+from jma.stations import get_catalog
+
+STATION_NAMES = [s.name_jp for s in get_catalog() if s.irradiation]
+
+DAILY_ELEMENT = '合計全天日射量(MJ/㎡)'
+HOURLY_ELEMENT = '日射量(MJ/㎡)'
+LTA = '平年値(MJ/㎡)'
+
+
+def generate_csv(resolution='daily', start_date=date(2000, 1, 1), days=365, stations=3, lta=False,
+                 missing_ratio=0.02, seed=0):
+    """Build a CSV payload.
+    Args:
+        resolution (str) - 'daily' or 'hourly'
+        start_date (datetime.date) - Date of the first row
+        days (int) - Number of days covered
+        stations (int) - Number of stations (at most len(STATION_NAMES))
+        lta (bool) - True to add a long-term average column per station
+        missing_ratio (float) - Share of cells left blank
+        seed (int) - Seed of the random number generator
+    Returns:
+        str - CSV text with CRLF line endings
+    """
+    rnd = random.Random(seed)
+    names = STATION_NAMES[:stations]
+    element = HOURLY_ELEMENT if resolution == 'hourly' else DAILY_ELEMENT
+    per_station = 2 if lta else 1
+    lines = [
+        'ダウンロードした時刻：2021/03/24 21:40:23',
+        '',
+        ',' + ','.join(name for name in names for _ in range(per_station)),
+        ',' + ','.join([element] * len(names) * per_station),
+    ]
+    if lta:
+        lines.append(',' + ','.join(['', LTA] * len(names)))
+
+    for d in range(days):
+        day = start_date + timedelta(days=d)
+        season = 1 + 0.5 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 80) / 365)
+        prefix = f'{day.year}年{day.month}月{day.day}日'
+        if resolution == 'hourly':
+            for hour in range(1, 25):
+                sun = max(0.0, math.sin(math.pi * (hour - 6) / 13)) * season * 1.6
+                cells = []
+                for _ in names:
+                    if sun == 0 or rnd.random() < missing_ratio:
+                        cells.append('--')
+                    else:
+                        cells.append(f'{sun * rnd.uniform(0.3, 1.0):.2f}')
+                    if lta:
+                        cells.append(f'{sun * 0.7:.2f}')
+                lines.append(f'{prefix}{hour}時,' + ','.join(cells))
+        else:
+            cells = []
+            for _ in names:
+                cells.append('' if rnd.random() < missing_ratio else f'{12 * season * rnd.uniform(0.2, 1.0):.2f}')
+                if lta:
+                    cells.append(f'{12 * season * 0.6:.1f}')
+            lines.append(f'{prefix},' + ','.join(cells))
+    lines.append('')
+    return '\r\n'.join(lines)
+
+
+def encode_csv(csv_data):
+    """Encode a payload the way the portal does"""
+    return csv_data.encode('cp932')
@@ -0,0 +1,110 @@
+"""Benchmarks of response parsing and end-to-end client latency.
+
+Usage:
+    python -m benchmarks.run [--days N] [--stations N] [--repeat N] [--only NAME]
+
+Parsing is measured on synthetic payloads (see benchmarks.generate). Throughput is the
+best of --repeat runs; peak memory is measured in a separate run with tracemalloc, since
+tracing slows parsing down. Client latency is measured against the local stand-in portal
+in jma.tests.portal, so it reflects client overhead rather than JMA's response time.
+"""
+import argparse
+from datetime import date, timedelta
+import gc
+import time
+import tracemalloc
+
+from benchmarks.generate import generate_csv, encode_csv
+from jma.client import JmaClient
+from jma.jmastation import JmaStation
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.tests.portal import MockPortal
+
+
+def measure(fn, repeat):
+    """
+    Returns:
+        Tuple[float, int] - Best wall time in seconds, peak traced memory in bytes
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def parse_benchmarks(days, stations):
+    """
+    Returns:
+        List[Tuple[str, int, Callable]] - (name, row count, function to measure)
+    """
+    daily = generate_csv('daily', days=days, stations=stations, lta=True)
+    hourly = generate_csv('hourly', days=days, stations=stations)
+    hourly_bytes = encode_csv(hourly)
+
+    def stream_hourly():
+        chunks = (hourly_bytes[i:i+65536] for i in range(0, len(hourly_bytes), 65536))
+        response = JmaHourlyIrradiationResponse.stream(chunks, encoding='cp932')
+        for _ in response.iter_rows():
+            pass
+
+    return [
+        ('parse daily (rows)', days, lambda: JmaIrradiationResponse(daily)),
+        ('parse daily (columnar)', days, lambda: JmaIrradiationResponse(daily, columnar=True)),
+        ('parse hourly (rows)', days * 24, lambda: JmaHourlyIrradiationResponse(hourly)),
+        ('parse hourly (columnar)', days * 24, lambda: JmaHourlyIrradiationResponse(hourly, columnar=True)),
+        ('parse hourly (epoch dates)', days * 24, lambda: JmaHourlyIrradiationResponse(hourly, date_type='epoch')),
+        ('stream hourly', days * 24, stream_hourly),
+    ]
+
+
+def client_benchmarks(portal, client, days, stations):
+    station_list = list(JmaStation)[:stations]
+    start = date(2000, 1, 1)
+    end = start + timedelta(days=days - 1)
+
+    def first_request():
+        with JmaClient(base_url=portal.base_url) as c:
+            c.get_hourly_irradiation(start, end, station_list)
+
+    def warm_request():
+        client.get_hourly_irradiation(start, end, station_list)
+
+    return [
+        ('client hourly (new client)', days * 24, first_request),
+        ('client hourly (warm session)', days * 24, warm_request),
+    ]
+
+
+def report(name, rows, seconds, peak):
+    print(f'{name:<32} {rows:>9} rows {seconds*1000:>10.1f} ms {rows/seconds:>12,.0f} rows/s '
+          f'{peak/2**20:>9.1f} MiB peak')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365, help='days of data per payload')
+    parser.add_argument('--stations', type=int, default=5, help='stations per payload')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this text')
+    args = parser.parse_args(argv)
+
+    benchmarks = parse_benchmarks(args.days, args.stations)
+    hourly = encode_csv(generate_csv('hourly', days=args.days, stations=args.stations))
+    with MockPortal(hourly) as portal, JmaClient(base_url=portal.base_url) as client:
+        benchmarks += client_benchmarks(portal, client, args.days, args.stations)
+        for name, rows, fn in benchmarks:
+            if args.only in name:
+                report(name, rows, *measure(fn, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
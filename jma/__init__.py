@@ -1,4 +1,5 @@
 """Package jma"""
 
 from jma.jmastation import JmaStation
-from jma.client import JmaClient
+from jma.elements import JmaElement
+from jma.client import JmaClient, JmaQuery, JmaResult
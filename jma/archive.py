@@ -0,0 +1,191 @@
+"""Re-parse archives of raw JMA CSV files on every core.
+
+    jma-reparse --resolution hourly --output hourly.parquet archive/
+
+Each file holds the body of one table.html response, as received (Shift-JIS). Files are
+parsed in a process pool, since the parser is pure Python and bound to a single core.
+Workers read their files themselves and send back columnar responses, which are cheap
+to transfer between processes.
+"""
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import sys
+
+from jma.exceptions import BadCsvException
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse, merge_responses
+from jma.writers import writer_for
+
+logger = logging.getLogger('jmaclient')
+
+RESPONSE_CLASSES = {
+    'daily': JmaIrradiationResponse,
+    'hourly': JmaHourlyIrradiationResponse,
+}
+
+ENCODING = 'shift-jis'
+MAX_ERROR_LENGTH = 200 # characters of an error message kept for the results and the log
+
+ArchiveResult = namedtuple('ArchiveResult', ['path', 'response', 'error'])
+ArchiveResult.__doc__ = """Outcome of parsing one archived file. Exactly one of response or error is set.
+    path (str) - The file
+    response (JmaIrradiationResponse) - Parsed response, or None if parsing failed
+    error (Exception) - Exception raised while reading or parsing the file, or None on success
+"""
+
+
+def iter_archive(paths, resolution='daily', kwh=False, columnar=False, date_type='iso', max_workers=None,
+                 encoding=ENCODING):
+    """Parse files in a process pool.
+    Args:
+        paths (List[str]) - Files to parse
+        resolution (str) - 'daily' or 'hourly'
+        kwh (bool) - If true MJ/m2 values will be converted to kWh/m2
+        columnar (bool) - If true, responses store their data as typed arrays
+        date_type (str) - Type of the Date values in rows: 'iso', 'datetime' or 'epoch'
+        max_workers (int) - Number of processes. Defaults to the number of CPUs.
+        encoding (str) - Encoding of the files. Undecodable bytes are replaced, as in JmaClient.
+    Yields:
+        ArchiveResult - One result per file, in the same order as paths. A file that fails
+            to parse does not abort the others. At most 2 * max_workers files are submitted
+            ahead of the consumer, so a slow consumer keeps memory use bounded.
+    """
+    if resolution not in RESPONSE_CLASSES:
+        raise ValueError(f'Unknown resolution: {resolution}')
+    max_workers = max_workers or os.cpu_count() or 1
+    window = deque()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for path in paths:
+                window.append(pool.submit(_parse_file, (path, resolution, kwh, date_type, encoding)))
+                if len(window) >= 2 * max_workers:
+                    yield _result(window.popleft().result(), columnar)
+            while window:
+                yield _result(window.popleft().result(), columnar)
+        finally:
+            # when the consumer stops early, files that have not started are not parsed
+            for future in window:
+                future.cancel()
+
+
+def _result(parsed, columnar):
+    path, response, error = parsed
+    if error is not None:
+        logger.error(f'Cannot parse {path}: {error!r}')
+    elif not columnar:
+        response._to_row_mode()
+    return ArchiveResult(path, response, error)
+
+
+def parse_archive(paths, resolution='daily', kwh=False, columnar=False, date_type='iso', max_workers=None,
+                  encoding=ENCODING):
+    """Parse files in a process pool and merge them into a single response aligned on Date
+    (see merge_responses).
+    Args:
+        See iter_archive
+    Returns:
+        JmaIrradiationResponse
+    Raises:
+        Exception - the error of the first file that could not be parsed
+    """
+    responses = []
+    for result in iter_archive(paths, resolution, kwh, columnar, date_type, max_workers, encoding):
+        if result.error is not None:
+            raise result.error
+        responses.append(result.response)
+    return merge_responses(responses)
+
+
+def _parse_file(task):
+    """Runs in a worker process"""
+    path, resolution, kwh, date_type, encoding = task
+    try:
+        with open(path, 'rb') as f:
+            text = f.read().decode(encoding, errors='replace')
+        response = RESPONSE_CLASSES[resolution](text, kwh=kwh, columnar=True, date_type=date_type)
+    except Exception as e:
+        return path, None, _small_error(e)
+    return path, response, None
+
+
+def _small_error(e):
+    """A copy of an exception with its message truncated. BadCsvException carries the whole
+    CSV text, which should neither be sent back to the parent process nor logged."""
+    message = str(e)
+    if len(message) <= MAX_ERROR_LENGTH:
+        return e
+    message = message[:MAX_ERROR_LENGTH] + '...'
+    try:
+        return type(e)(message)
+    except Exception:
+        return BadCsvException(f'{type(e).__name__}: {message}')
+
+
+def find_files(paths, suffix='.csv'):
+    """Expand directories into the files they contain, recursively and in sorted order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [os.path.join(root, name) for name in sorted(names) if name.endswith(suffix)]
+        else:
+            files.append(path)
+    return files
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='jma-reparse', description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='+', help='raw CSV files, or directories of them')
+    parser.add_argument('--output', required=True, help='output file: .csv, .parquet or .arrow')
+    parser.add_argument('--resolution', choices=['daily', 'hourly'], default='daily')
+    parser.add_argument('--merge', action='store_true',
+                        help='align all files on Date in memory; required when files cover different stations')
+    parser.add_argument('--kwh', action='store_true', help='write irradiation in kWh/m2 instead of MJ/m2')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per CPU)')
+    parser.add_argument('--encoding', default=ENCODING, help='encoding of the raw files')
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the jma-reparse command.
+    Returns:
+        int - Exit status: 0 when every file has been parsed, 1 otherwise
+    """
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    files = find_files(args.paths)
+    results = iter_archive(files, args.resolution, kwh=args.kwh, columnar=True, max_workers=args.workers,
+                           encoding=args.encoding)
+    failed = 0
+    try:
+        with writer_for(args.output) as w:
+            if args.merge:
+                responses = []
+                for result in results:
+                    if result.error is None:
+                        responses.append(result.response)
+                    else:
+                        failed += 1
+                if responses:
+                    w.write(merge_responses(responses))
+            else:
+                for result in results:
+                    if result.error is None:
+                        w.write(result.response)
+                    else:
+                        failed += 1
+    except ValueError as e:
+        logger.error(f'{e}. Files with different stations can only be combined with --merge.')
+        return 1
+    if w.headers is None:
+        logger.error(f'None of the {len(files)} files could be parsed; no output was written')
+        return 1
+    logger.info(f'Parsed {len(files) - failed} of {len(files)} files into {args.output} ({w.rows_written} rows)')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
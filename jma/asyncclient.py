@@ -0,0 +1,103 @@
+"""asyncio counterpart of jma.client.JmaClient.
+Requires the optional aiohttp dependency (pip install jma-client[async]).
+"""
+import asyncio
+import logging
+from urllib.parse import urlencode
+
+import aiohttp
+
+from jma.client import BASE_URL, build_params, request_headers, extract_php_sessid, raise_if_html
+from jma.exceptions import JmaException, BadCsvException
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+
+logger = logging.getLogger('jmaclient')
+
+
+class AsyncJmaClient():
+
+    TIMEOUT = 3 # seconds
+    MAX_CONCURRENCY = 4
+
+    def __init__(self, kwh=False, max_concurrency=MAX_CONCURRENCY, base_url=BASE_URL):
+        """
+        Args:
+            kwh (bool) - If true, values will be converted from MJ/m2 to kWh/m2
+            max_concurrency (int) - Maximum number of requests in flight at once
+            base_url (str) - Root of the obsdl portal, ending with a slash
+        """
+        self.sess = None
+        self.php_sessid = None
+        self.kwh = kwh
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self.sess = aiohttp.ClientSession(timeout=timeout, connector=connector)
+        try:
+            async with self.sess.get(self.base_url + 'index.php') as res:
+                res.raise_for_status()
+                html = await res.text()
+            self.php_sessid = extract_php_sessid(html)
+        except BaseException:
+            await self.sess.close()
+            raise
+        return self
+
+    async def __aexit__(self, a, b, c):
+        await self.sess.close()
+
+    async def _send_request(self, params):
+        """POST the form to table.html and return the decoded CSV text"""
+        uri = self.base_url + 'show/table.html'
+        hdr = request_headers(self.base_url)
+        # encode the same way requests does: lists are repeated, empty lists are dropped
+        body = urlencode(params, doseq=True)
+        async with self._semaphore:
+            async with self.sess.post(uri, data=body, headers=hdr) as res:
+                content = await res.read()
+                status = res.status
+        try:
+            if status >= 400:
+                raise aiohttp.ClientResponseError(res.request_info, res.history, status=status)
+            text = content.decode('shift-jis', errors='replace')
+            raise_if_html(text)
+        except aiohttp.ClientResponseError:
+            logger.exception(f'POST request failed. Request body: {body}')
+            raise JmaException('Request failed')
+        except BadCsvException:
+            logger.exception(f'POST request failed. Request body: {body}')
+            raise
+        return text
+
+    async def get_daily_irradiation(self, start_date, end_date, stations, lta=False):
+        """Download irradiation data in increments of 1 day.
+        Args:
+            start_date (datetime.date) - First date for which irradiation data will be downloaded
+            end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
+            stations (List[JmaStation]) - Iterable of JmaStation
+            lta (bool) - True if long-term average irradation should be included in results
+        Returns:
+            JmaIrradiationResponse
+        """
+        params = build_params('daily', start_date, end_date, stations, lta, self.php_sessid)
+        text = await self._send_request(params)
+        return JmaIrradiationResponse(text, kwh=self.kwh)
+
+    async def get_hourly_irradiation(self, start_date, end_date, stations, lta=False):
+        """Download irradiation data in increments of 1 hour.
+        Args:
+            start_date (datetime.date) - First date for which irradiation data will be downloaded
+            end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
+            stations (List[JmaStation]) - Iterable of JmaStation
+            lta (bool) - True if long-term average irradation should be included in results
+        Returns:
+            JmaIrradiationResponse
+        """
+        params = build_params('hourly', start_date, end_date, stations, lta, self.php_sessid)
+        text = await self._send_request(params)
+        return JmaHourlyIrradiationResponse(text, kwh=self.kwh)
@@ -0,0 +1,261 @@
+"""Resumable bulk downloads.
+
+    jma-backfill --stations all --start 2015-01-01 --end 2020-12-31 --resolution hourly --output data/
+
+The date range and station list are split into portal-sized chunks (see plan_requests).
+Each completed chunk is written to its own file (CSV, Parquet or Arrow IPC) in the output directory, and recorded in
+a checkpoint manifest (manifest.json) right after. Chunk files are named after a hash of the
+chunk's stations (see chunk_key); the manifest also records a readable description of each chunk. When the same command is run again,
+chunks that are already in the manifest are skipped, so an interrupted job resumes where
+it stopped. Failed chunks are reported and retried on the next run.
+"""
+import argparse
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from jma.client import JmaClient, JmaQuery, plan_requests, BASE_URL, MAX_CELLS
+from jma.elements import JmaElement
+from jma.jmastation import JmaStation
+from jma.scheduler import RequestScheduler
+from jma.writers import FORMATS, WRITERS
+
+logger = logging.getLogger('jmaclient')
+
+MANIFEST = 'manifest.json'
+
+
+class Backfill():
+    """A bulk download into a directory, checkpointed after every chunk"""
+
+    def __init__(self, output, resolution, start_date, end_date, stations, lta=False, elements=None,
+                 kwh=False, max_cells=MAX_CELLS, format='csv'):
+        """
+        Args:
+            output (str) - Directory that receives the chunk files and the manifest
+            resolution (str) - 'daily' or 'hourly'
+            start_date (datetime.date) - First date to download
+            end_date (datetime.date) - Last date (inclusive) to download
+            stations (List[JmaStation]) - Iterable of JmaStation
+            lta (bool) - True if long-term averages should be downloaded
+            elements (List[JmaElement]) - Elements to download. Defaults to global irradiation only.
+            kwh (bool) - If true, irradiation is written in kWh/m2 instead of MJ/m2
+            max_cells (int) - Maximum number of CSV cells per request
+            format (str) - Format of the chunk files: 'csv', 'parquet' or 'arrow'
+        """
+        if format not in FORMATS:
+            raise ValueError(f'Unknown format: {format}')
+        self.output = output
+        self.extension = FORMATS[format]
+        self.kwh = kwh
+        self.stations = list(stations)
+        self.elements = list(elements) if elements is not None else None
+        self.queries = plan_requests(start_date, end_date, self.stations, resolution, lta, max_cells,
+                                     self.elements)
+        # Everything that changes the content of the chunk files. Resuming with different
+        # settings would mix incompatible files in the same directory.
+        self.job = {
+            'resolution': resolution,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'stations': [stn.value for stn in self.stations],
+            'lta': lta,
+            'elements': [e.value for e in self.elements] if self.elements is not None else None,
+            'kwh': kwh,
+            'max_cells': max_cells,
+            'format': format,
+        }
+        self.manifest_path = os.path.join(output, MANIFEST)
+        self.completed = {} # chunk key -> {'file': file name, 'chunk': description}
+
+    def load_manifest(self):
+        """Read the checkpoint of a previous run, if any.
+        Raises:
+            ValueError - if the manifest belongs to a job with different settings
+        """
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        if manifest['job'] != self.job:
+            raise ValueError(f'{self.manifest_path} belongs to a different job: {manifest["job"]}')
+        self.completed = manifest['chunks']
+
+    def pending(self):
+        """
+        Returns:
+            List[JmaQuery] - Chunks that have not been downloaded yet
+        """
+        return [q for q in self.queries if chunk_key(q) not in self.completed]
+
+    def run(self, client, max_workers=JmaClient.MAX_WORKERS):
+        """Download every pending chunk.
+        Args:
+            client (JmaClient) - An open client
+            max_workers (int) - Maximum number of requests in flight at once
+        Returns:
+            List[JmaResult] - Results of the chunks that failed
+        """
+        os.makedirs(self.output, exist_ok=True)
+        self.load_manifest()
+        pending = self.pending()
+        logger.info(f'{len(self.queries) - len(pending)} of {len(self.queries)} chunks already downloaded')
+        failed = []
+        for result in client.iter_many(pending, max_workers=max_workers):
+            if result.error is not None:
+                failed.append(result)
+                continue
+            key = chunk_key(result.query)
+            filename = key + self.extension
+            self.write_chunk(filename, result.response)
+            self.completed[key] = {'file': filename, 'chunk': describe_chunk(result.query)}
+            self.save_manifest()
+            logger.info(f'Chunk {key} done ({len(self.completed)}/{len(self.queries)})')
+        return failed
+
+    def write_chunk(self, filename, response):
+        # written under a temporary name first, so that an interrupted job never leaves a partial file behind
+        tmp = os.path.join(self.output, filename + '.tmp')
+        try:
+            with WRITERS[self.extension](tmp) as w:
+                w.write(response)
+            os.replace(tmp, os.path.join(self.output, filename))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def save_manifest(self):
+        atomic_write(self.manifest_path, json.dumps({'job': self.job, 'chunks': self.completed}, indent=1))
+
+
+def chunk_key(query: JmaQuery) -> str:
+    """Short, stable and file name friendly identifier of a chunk, e.g. 'daily_20210101-20210331_5f0c6e2a91'.
+    A chunk may hold every station, so the stations, elements and lta flag are hashed rather than listed."""
+    elements = ','.join(str(e.value) for e in query.elements) if query.elements is not None else ''
+    ident = '|'.join([','.join(stn.value for stn in query.stations), elements, str(query.lta)])
+    digest = hashlib.sha1(ident.encode('utf-8')).hexdigest()[:10]
+    return '{}_{:%Y%m%d}-{:%Y%m%d}_{}'.format(query.resolution, query.start_date, query.end_date, digest)
+
+
+def describe_chunk(query: JmaQuery) -> str:
+    """Readable description of a chunk, e.g. 'daily 2021-01-01..2021-03-31 Fukuoka,Saga'"""
+    return '{} {}..{} {}'.format(query.resolution, query.start_date.isoformat(), query.end_date.isoformat(),
+                                 ','.join(stn.name for stn in query.stations))
+
+
+def atomic_write(path, text):
+    """Write to a temporary file that replaces path once it is complete"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def parse_stations(text, irradiation=False):
+    """
+    Args:
+        text (str) - 'all', or a comma separated list of station names (e.g. Fukuoka) or ids (e.g. s47807)
+        irradiation (bool) - If true, 'all' only means the stations that observe irradiation
+    Returns:
+        List[JmaStation]
+    """
+    if text == 'all':
+        return [stn for stn in JmaStation if stn.info.irradiation or not irradiation]
+    stations = []
+    for token in text.split(','):
+        token = token.strip()
+        try:
+            stations.append(JmaStation[token] if token in JmaStation.__members__ else JmaStation(token))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'Unknown station: {token}')
+    return stations
+
+
+def parse_elements(text):
+    """
+    Args:
+        text (str) - Comma separated list of element names (e.g. SunshineDuration) or numbers (e.g. 401)
+    Returns:
+        List[JmaElement]
+    """
+    elements = []
+    for token in text.split(','):
+        token = token.strip()
+        try:
+            elements.append(JmaElement[token] if token in JmaElement.__members__ else JmaElement(token))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'Unknown element: {token}')
+    return elements
+
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Not a YYYY-MM-DD date: {text}')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='jma-backfill', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stations', required=True,
+                        help="'all', or comma separated station names or ids. Without --elements, "
+                             "'all' only includes the stations that observe irradiation.")
+    parser.add_argument('--start', type=parse_date, required=True, help='first date, YYYY-MM-DD')
+    parser.add_argument('--end', type=parse_date, required=True, help='last date (inclusive), YYYY-MM-DD')
+    parser.add_argument('--resolution', choices=['daily', 'hourly'], default='daily')
+    parser.add_argument('--output', required=True, help='directory for the chunk files and the checkpoint')
+    parser.add_argument('--elements', type=parse_elements, default=None,
+                        help='comma separated element names or numbers (default: global irradiation)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='format of the chunk files')
+    parser.add_argument('--lta', action='store_true', help='include long-term averages')
+    parser.add_argument('--kwh', action='store_true', help='write irradiation in kWh/m2 instead of MJ/m2')
+    parser.add_argument('--max-cells', type=int, default=MAX_CELLS, help='maximum CSV cells per request')
+    parser.add_argument('--workers', type=int, default=JmaClient.MAX_WORKERS,
+                        help='maximum number of requests in flight')
+    parser.add_argument('--rate', type=float, default=2.0, help='maximum requests per second')
+    parser.add_argument('--base-url', default=BASE_URL, help='root of the obsdl portal')
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the jma-backfill command.
+    Returns:
+        int - Exit status: 0 when every chunk has been downloaded, 1 otherwise
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        stations = parse_stations(args.stations, irradiation=args.elements is None)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    job = Backfill(args.output, args.resolution, args.start, args.end, stations, lta=args.lta,
+                   elements=args.elements, kwh=args.kwh, max_cells=args.max_cells, format=args.format)
+    scheduler = RequestScheduler(rate=args.rate)
+    try:
+        with JmaClient(kwh=args.kwh, base_url=args.base_url, scheduler=scheduler) as c:
+            failed = job.run(c, max_workers=args.workers)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    if failed:
+        for result in failed:
+            logger.error(f'Chunk {chunk_key(result.query)} ({describe_chunk(result.query)}) failed: {result.error!r}')
+        logger.error(f'{len(failed)} chunks failed; run the same command again to retry them')
+        return 1
+    logger.info(f'All {len(job.queries)} chunks downloaded to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""On-disk cache of downloaded observations, backed by SQLite.
+
+Observations are keyed by station id, element number, resolution and timestamp.
+Long-term averages are stored under the element number followed by _LT. Irradiation is
+always stored in MJ/m2, regardless of the kwh setting of the client that fetched it.
+"""
+from datetime import date, datetime, timedelta
+import logging
+import sqlite3
+import threading
+import time
+
+from jma.client import PERIODS_PER_DAY
+from jma.elements import JmaElement, LTA_SUFFIX, element_key
+
+logger = logging.getLogger('jmaclient')
+
+
+
+class JmaCache():
+
+    VOLATILE_DAYS = 3
+
+    def __init__(self, path=':memory:', volatile_days=VOLATILE_DAYS, ttl=None, today=date.today):
+        """
+        Args:
+            path (str) - Location of the SQLite database file
+            volatile_days (int) - Number of trailing days (up to and including today) that
+                are always refetched, because JMA may still revise them
+            ttl (float) - If set, cached values older than this many seconds are refetched
+            today (Callable[[], datetime.date]) - Returns the current date
+        """
+        self.volatile_days = volatile_days
+        self.ttl = ttl
+        self.today = today
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS observations (
+                station TEXT NOT NULL,
+                element TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                value REAL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (station, element, resolution, timestamp)
+            ) WITHOUT ROWID''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS labels (
+                station TEXT PRIMARY KEY,
+                label TEXT NOT NULL
+            )''')
+
+    def close(self):
+        self.conn.close()
+
+    def missing_ranges(self, resolution, start_date, end_date, stations, lta=False, elements=None):
+        """Find the date ranges that have to be downloaded to answer a request.
+        A day is missing unless every requested station and element has a value for
+        every period of that day. Volatile days are always missing.
+        Args:
+            resolution (str) - 'daily' or 'hourly'
+            start_date (datetime.date) - First date of the request
+            end_date (datetime.date) - Last date (inclusive) of the request
+            stations (List[JmaStation]) - Iterable of JmaStation
+            lta (bool) - True if long-term averages are part of the request
+            elements (List[JmaElement]) - Requested elements. Defaults to global irradiation.
+        Returns:
+            List[Tuple[datetime.date, datetime.date]] - Inclusive (start, end) ranges
+        """
+        station_ids = [stn.value for stn in stations]
+        keys = _element_keys(elements, lta)
+        expected = len(station_ids) * len(keys) * PERIODS_PER_DAY[resolution]
+        min_fetched_at = time.time() - self.ttl if self.ttl is not None else 0
+        sql = '''SELECT substr(timestamp, 1, 10), COUNT(*) FROM observations
+                 WHERE resolution = ? AND timestamp >= ? AND timestamp < ? AND fetched_at >= ?
+                 AND station IN ({}) AND element IN ({})
+                 GROUP BY substr(timestamp, 1, 10)'''.format(_marks(station_ids), _marks(keys))
+        args = [resolution, start_date.isoformat(), (end_date + timedelta(days=1)).isoformat(),
+                min_fetched_at] + station_ids + keys
+        with self.lock:
+            counts = dict(self.conn.execute(sql, args).fetchall())
+
+        first_volatile = self.today() - timedelta(days=self.volatile_days - 1)
+        ranges = []
+        d = start_date
+        while d <= end_date:
+            if d >= first_volatile or counts.get(d.isoformat()) != expected:
+                if ranges and ranges[-1][1] == d - timedelta(days=1):
+                    ranges[-1] = (ranges[-1][0], d)
+                else:
+                    ranges.append((d, d))
+            d += timedelta(days=1)
+        return ranges
+
+    def store(self, resolution, stations, response, lta=False, elements=None):
+        """Save the contents of a response.
+        Args:
+            resolution (str) - 'daily' or 'hourly'
+            stations (List[JmaStation]) - Stations in the order they were requested
+            response (JmaIrradiationResponse) - Response parsed without kWh conversion
+            lta (bool) - True if long-term averages were requested
+            elements (List[JmaElement]) - Requested elements. Defaults to global irradiation.
+        """
+        if response.convert_to_kwh:
+            raise ValueError('Only MJ/m2 values can be cached')
+        try:
+            keys = response.column_keys(stations, elements)
+        except ValueError as e:
+            logger.warning(f'{e}; response not cached')
+            return
+
+        now = time.time()
+        records = []
+        for row in response.csv:
+            for (station, element), hdr in zip(keys, response.headers[1:]):
+                records.append((station, element, resolution, row['Date'], row[hdr], now))
+        labels = set((station, name) for (station, _), name in zip(keys, response.stations))
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)', records)
+            self.conn.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?)', labels)
+
+    def load(self, response_class, resolution, start_date, end_date, stations, lta=False, kwh=False,
+             date_type='iso', elements=None, columnar=False):
+        """Assemble a response from cached values.
+        Args:
+            response_class (type) - JmaIrradiationResponse or one of its subclasses
+            resolution (str) - 'daily' or 'hourly'
+            start_date (datetime.date) - First date to load
+            end_date (datetime.date) - Last date (inclusive) to load
+            stations (List[JmaStation]) - Iterable of JmaStation
+            lta (bool) - True if long-term averages should be included
+            kwh (bool) - If true MJ/m2 values will be converted to kWh/m2
+            date_type (str) - Type of the Date values in rows: 'iso', 'datetime' or 'epoch'
+            elements (List[JmaElement]) - Requested elements. Defaults to global irradiation.
+            columnar (bool) - If true, the response stores its data as typed arrays
+        Returns:
+            JmaIrradiationResponse
+        """
+        stations = list(stations)
+        station_ids = [stn.value for stn in stations]
+        elements = list(elements or [JmaElement.GlobalIrradiation])
+        keys = _element_keys(elements, lta)
+        sql = '''SELECT station, element, timestamp, value FROM observations
+                 WHERE resolution = ? AND timestamp >= ? AND timestamp < ?
+                 AND station IN ({}) AND element IN ({})
+                 ORDER BY timestamp'''.format(_marks(station_ids), _marks(keys))
+        args = [resolution, start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()]
+        args += station_ids + keys
+        with self.lock:
+            records = self.conn.execute(sql, args).fetchall()
+            labels = dict(self.conn.execute(
+                f'SELECT station, label FROM labels WHERE station IN ({_marks(station_ids)})', station_ids))
+
+        response = response_class(kwh=kwh, date_type=date_type)
+        columns = {} # (station, element key) -> position in the row
+        headers = ['Date']
+        for stn in stations:
+            label = labels.get(stn.value, stn.name)
+            for element in elements:
+                for is_lta in ((False, True) if lta else (False,)):
+                    hdr = label
+                    if len(elements) > 1:
+                        hdr += '_' + element.name
+                    if is_lta:
+                        hdr += '_LT'
+                    columns[(stn.value, element_key(element, is_lta))] = len(headers)
+                    headers.append(hdr)
+                    response.stations.append(label)
+                    response.elements.append(element)
+                    response.lta_flags.append(is_lta)
+                    response._kwh_columns.append(element == JmaElement.GlobalIrradiation)
+
+        rows = {}
+        for station, element, timestamp, value in records:
+            position = columns[(station, element)]
+            if kwh and value is not None and element.startswith(JmaElement.GlobalIrradiation.value):
+                value = value / 3.6 # 3.6 MJ/m2 = 1 kWh/m2
+            row = rows.get(timestamp)
+            if row is None:
+                row = rows[timestamp] = [None] * len(headers)
+                if date_type == 'iso':
+                    row[0] = timestamp
+                else:
+                    row[0] = response._date_value(datetime.strptime(timestamp, response.DATE_FORMAT))
+            row[position] = value
+        response.headers = headers
+        row_class = response._get_row_class()
+        response.csv = [row_class(tuple(values)) for values in rows.values()]
+        if columnar:
+            response.timestamps, response.columns = response._columns_from_rows()
+            response.columnar = True
+            response.csv = None
+        return response
+
+
+def _element_keys(elements, lta):
+    keys = [e.value for e in (elements or [JmaElement.GlobalIrradiation])]
+    if lta:
+        keys += [k + LTA_SUFFIX for k in keys]
+    return keys
+
+
+def _marks(seq):
+    return ','.join('?' * len(seq))
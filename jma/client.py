@@ -1,161 +1,633 @@
 """Download daily irradiation data from the Japanese Meteorological Association
 (https://www.data.jma.go.jp/gmd/risk/obsdl/index.php).
 """
-from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+import itertools
 import logging
-import requests
+import math
+import threading
+import time
+from time import perf_counter
+from urllib.parse import urlsplit
 
-from jma.exceptions import JmaException, NoSessionIdException, BadCsvException
+from jma.coalesce import RequestCoalescer
+from jma.elements import JmaElement, encode_elements
+from jma.exceptions import JmaException, NoSessionIdException, BadCsvException, HtmlPageException
 from jma.jmastation import JmaStation
-from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.metrics import RequestMetrics
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse, merge_responses, EPOCH, JST_OFFSET
 
 logger = logging.getLogger('jmaclient')
 
 
+JmaQuery = namedtuple('JmaQuery', ['resolution', 'start_date', 'end_date', 'stations', 'lta', 'elements'])
+JmaQuery.__new__.__defaults__ = (False, None) # lta, elements
+JmaQuery.__doc__ = """A single download request, as accepted by JmaClient.get_many.
+    resolution (str) - 'daily' or 'hourly'
+    start_date (datetime.date) - First date for which irradiation data will be downloaded
+    end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
+    stations (List[JmaStation]) - Iterable of JmaStation
+    lta (bool) - True if long-term average irradation should be included in results
+    elements (List[JmaElement]) - Elements to download. None for global irradiation only.
+"""
+
+JmaResult = namedtuple('JmaResult', ['query', 'response', 'error'])
+JmaResult.__doc__ = """Outcome of a JmaQuery. Exactly one of response or error is set.
+    query (JmaQuery) - The query that produced this result
+    response (JmaIrradiationResponse) - Parsed response, or None if the request failed
+    error (Exception) - Exception raised while running the query, or None on success
+"""
+
+
+BASE_URL = 'https://www.data.jma.go.jp/gmd/risk/obsdl/'
+
+# Value of the aggrgPeriod form field for each resolution
+AGGREGATION_PERIODS = {
+    'daily': 1,
+    'hourly': 9,
+}
+
+RESPONSE_CLASSES = {
+    'daily': JmaIrradiationResponse,
+    'hourly': JmaHourlyIrradiationResponse,
+}
+
+# The portal refuses to build a CSV whose size (stations x columns x time steps)
+# exceeds roughly this many cells, and returns an HTML error page instead.
+MAX_CELLS = 10000
+
+PERIODS_PER_DAY = {
+    'daily': 1,
+    'hourly': 24,
+}
+
+
 class JmaClient():
 
     TIMEOUT = 3 # seconds
+    MAX_WORKERS = 4
+    STREAM_CHUNK_SIZE = 64 * 1024 # bytes
 
-    def __init__(self, kwh=False):
+    def __init__(self, kwh=False, base_url=BASE_URL, cache=None, columnar=False, date_type='iso',
+                 session_store=None, observer=None, scheduler=None, coalesce=True):
         """
         Args:
             kwh (bool) - If true, values will be converted from MJ/m2 to kWh/m2
+            base_url (str) - Root of the obsdl portal, ending with a slash
+            cache (jma.cache.JmaCache) - If set, only data missing from the cache is downloaded
+            columnar (bool) - If true, responses store their data as typed arrays
+                (see JmaIrradiationResponse)
+            date_type (str) - Type of the Date values in rows: 'iso', 'datetime' or 'epoch'
+            session_store (jma.session.MemorySessionStore or jma.session.FileSessionStore) - If set,
+                the PHP Session ID is shared with other clients using the same store
+            observer (Callable[[jma.metrics.RequestMetrics], None]) - Called after every download
+                with its timings and counters (see jma.metrics)
+            scheduler (jma.scheduler.RequestScheduler) - If set, POST requests are rate limited
+                and retried by this scheduler, which may be shared with other clients
+            coalesce (bool) - If true, a download that is covered by one already in flight
+                (same resolution, stations and options, and a date range that includes it)
+                waits for that one instead of sending another POST (see jma.coalesce)
         """
         self.sess = None
         self.php_sessid = None
+        self.session_store = session_store
+        self.session_lock = threading.Lock()
         self.kwh = kwh
+        self.base_url = base_url
+        self.cache = cache
+        self.columnar = columnar
+        self.date_type = date_type
+        self.observer = observer
+        self.scheduler = scheduler
+        self.coalescer = RequestCoalescer() if coalesce else None
 
     def __enter__(self):
+        # requests is imported here rather than at module level, so that importing jma stays cheap
+        import requests
+        # The PHP Session ID is only fetched once the first request needs it
         self.sess = requests.Session()
-        res = self._get('https://www.data.jma.go.jp/gmd/risk/obsdl/index.php')
-        res.raise_for_status()
-        self.php_sessid = extract_php_sessid(res.text)
         return self
 
     def __exit__(self, a, b, c):
-        pass
+        self.sess.close()
+
+    def _session_id(self, metrics):
+        """Return the PHP Session ID, bootstrapping a new session if there is none yet"""
+        with self.session_lock:
+            if self.php_sessid is None and self.session_store is not None:
+                self.php_sessid = self.session_store.get()
+            if self.php_sessid is None:
+                self._bootstrap_session(metrics)
+            return self.php_sessid
+
+    def _refresh_session_id(self, stale, metrics):
+        """Replace an expired PHP Session ID. If another thread already replaced it, use theirs."""
+        with self.session_lock:
+            if self.php_sessid == stale:
+                logger.info('Refreshing PHP Session ID')
+                self._bootstrap_session(metrics)
+            return self.php_sessid
+
+    def _bootstrap_session(self, metrics):
+        t = perf_counter()
+        res = self._get(self.base_url + 'index.php')
+        res.raise_for_status()
+        self.php_sessid = extract_php_sessid(res.text)
+        metrics.add_bootstrap_time(perf_counter() - t)
+        if self.session_store is not None:
+            self.session_store.set(self.php_sessid)
+
+    def _with_session(self, attempt, metrics):
+        """Call attempt(php_sessid). JMA answers with its HTML page instead of CSV when the
+        session has expired, so on HtmlPageException a new session is bootstrapped and the
+        attempt is repeated once. Other parse errors are not retried."""
+        t = perf_counter()
+        try:
+            sid = self._session_id(metrics)
+            try:
+                return attempt(sid)
+            except HtmlPageException:
+                sid = self._refresh_session_id(sid, metrics)
+                metrics.retries += 1
+                return attempt(sid)
+        except Exception as e:
+            metrics.error = e
+            raise
+        finally:
+            metrics.total_time = perf_counter() - t
+            self._notify(metrics)
+
+    def _notify(self, metrics):
+        if self.observer is None:
+            return
+        try:
+            self.observer(metrics)
+        except Exception:
+            logger.exception('Observer failed')
 
     def _get(self, *args, **kwargs):
         if 'timeout' not in kwargs:
             kwargs['timeout'] = self.TIMEOUT
         return self.sess.get(*args, **kwargs)
     
-    def _post(self, *args, **kwargs):
+    def _post(self, *args, metrics=None, **kwargs):
         if 'timeout' not in kwargs:
             kwargs['timeout'] = self.TIMEOUT
-        return self.sess.post(*args, **kwargs)
-
-    def _send_request(self, params):
-        uri = 'https://www.data.jma.go.jp/gmd/risk/obsdl/show/table.html'
-        hdr = {
-            'Host':               'www.data.jma.go.jp',
-            'User-Agent':         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:84.0) Gecko/20100101 Firefox/84.0',
-            'Accept':             'text/html, */*; q=0.01',
-            'Accept-Language':    'en-US,en;q=0.5',
-            'Accept-Encoding':    'gzip, deflate, br',
-            'Content-Type':       'application/x-www-form-urlencoded; charset=UTF-8',
-            'Origin':             'https://www.data.jma.go.jp',
-            'DNT':                '1',
-            'Connection':         'keep-alive',
-            'Referer':            'https://www.data.jma.go.jp/gmd/risk/obsdl/index.php',
-        }
-        
-        res = self._post(uri, data=params, headers=hdr)
+        if self.scheduler is None:
+            return self.sess.post(*args, **kwargs)
+
+        def on_retry():
+            if metrics is not None:
+                metrics.retries += 1
+        return self.scheduler.run(lambda: self.sess.post(*args, **kwargs), on_retry)
+
+    def _ensure_pool_size(self, size):
+        """requests keeps at most 10 connections per host by default. Make sure
+        every worker thread can hold on to its own keep-alive connection."""
+        from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+        if size > DEFAULT_POOLSIZE:
+            scheme = urlsplit(self.base_url).scheme
+            self.sess.mount(f'{scheme}://', HTTPAdapter(pool_maxsize=size))
+
+    def _send_request(self, params, stream=False, metrics=None):
+        """POST the form to table.html.
+        The response is returned undecoded; see _decode. With stream=True the body is left
+        unread, and the caller is responsible for detecting an HTML error page while parsing it."""
+        from requests.exceptions import HTTPError
+        uri = self.base_url + 'show/table.html'
+        hdr = request_headers(self.base_url)
+        t = perf_counter()
+        res = self._post(uri, data=params, headers=hdr, stream=stream, metrics=metrics)
+        if metrics is not None:
+            metrics.post_time = perf_counter() - t
+            metrics.status = res.status_code
+            if not stream:
+                metrics.response_bytes = len(res.content)
         try:
             res.raise_for_status()
-            raise_if_html(res.text)
-        except requests.exceptions.HTTPError:
+        except HTTPError:
             logger.exception(f'POST request failed. Request body: {res.request.body}')
             raise JmaException('Request failed')
+        res.encoding = 'shift-jis'
+        return res
+
+    def _decode(self, res, metrics):
+        """Decode the body of a table.html response, which must be CSV"""
+        t = perf_counter()
+        text = res.text
+        metrics.decode_time = perf_counter() - t
+        try:
+            raise_if_html(text)
         except BadCsvException:
             logger.exception(f'POST request failed. Request body: {res.request.body}')
+            if self.scheduler is not None:
+                self.scheduler.report_overload()
             raise
-        res.encoding = 'shift-jis'
-        return res
+        return text
 
-    def get_daily_irradiation(self, start_date, end_date, stations, lta=False):
+    def get_daily_observations(self, start_date, end_date, stations, elements, lta=False, stream=False):
+        """Download several observation elements in increments of 1 day, with a single request.
+        Only irradiation columns are affected by the kwh setting of the client.
+        Args:
+            start_date (datetime.date) - First date for which data will be downloaded
+            end_date (datetime.date) - Last date (inclusive) for which data will be downloaded
+            stations (List[JmaStation]) - Iterable of JmaStation
+            elements (List[JmaElement]) - Iterable of JmaElement
+            lta (bool) - True if long-term averages should be included in results
+            stream (bool) - If true, return as soon as the header lines have arrived (see get_daily_irradiation)
+        Returns:
+            JmaIrradiationResponse - Use response.series() to access the values by station and element
+        """
+        return self._get_irradiation('daily', start_date, end_date, stations, lta, stream, list(elements))
+
+    def get_hourly_observations(self, start_date, end_date, stations, elements, lta=False, stream=False):
+        """Download several observation elements in increments of 1 hour, with a single request.
+        Only irradiation columns are affected by the kwh setting of the client.
+        Args:
+            start_date (datetime.date) - First date for which data will be downloaded
+            end_date (datetime.date) - Last date (inclusive) for which data will be downloaded
+            stations (List[JmaStation]) - Iterable of JmaStation
+            elements (List[JmaElement]) - Iterable of JmaElement
+            lta (bool) - True if long-term averages should be included in results
+            stream (bool) - If true, return as soon as the header lines have arrived (see get_daily_irradiation)
+        Returns:
+            JmaIrradiationResponse - Use response.series() to access the values by station and element
+        """
+        return self._get_irradiation('hourly', start_date, end_date, stations, lta, stream, list(elements))
+
+    def get_daily_irradiation(self, start_date, end_date, stations, lta=False, stream=False):
         """Download irradiation data in increments of 1 day.
         Args:
             start_date (datetime.date) - First date for which irradiation data will be downloaded
             end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
             stations (List[JmaStation]) - Iterable of JmaStation
             lta (bool) - True if long-term average irradation should be included in results
+            stream (bool) - If true, return as soon as the header lines have arrived and parse
+                rows while they are downloaded. Use response.iter_rows() to consume them.
         Returns:
             JmaIrradiationResponse
         """
-        date_arr = [
-            start_date.year,
-            end_date.year,
-            start_date.month,
-            end_date.month,
-            start_date.day,
-            end_date.day,
-        ]
-        opts = '[["op1",0]]' if lta else []
-        params = {
-            'stationNumList':       encode_list_for_jma([stn.value for stn in stations]),
-            'aggrgPeriod':          1,
-            'elementNumList':       '[["610",""]]',
-            'interAnnualFlag':      1,
-            'ymdList':             	encode_list_for_jma(date_arr),
-            'optionNumList':        opts,
-            'downloadFlag':         True,
-            'rmkFlag':              0,
-            'disconnectFlag':       0,
-            'youbiFlag':            0,
-            'fukenFlag':            0,
-            'kijiFlag':             0,
-            'huukouFlag':           0,
-            'csvFlag':              0,
-            'jikantaiFlag':         0,
-            'jikantaiList':         [],
-            'ymdLiteral':           1,
-            'PHPSESSID':            self.php_sessid,
-        }
-        res = self._send_request(params)
-        return JmaIrradiationResponse(res.text, kwh=self.kwh)
-
-    def get_hourly_irradiation(self, start_date, end_date, stations, lta=False):
+        return self._get_irradiation('daily', start_date, end_date, stations, lta, stream)
+
+    def get_hourly_irradiation(self, start_date, end_date, stations, lta=False, stream=False):
         """Download irradiation data in increments of 1 hour.
         Args:
             start_date (datetime.date) - First date for which irradiation data will be downloaded
             end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
             stations (List[JmaStation]) - Iterable of JmaStation
             lta (bool) - True if long-term average irradation should be included in results
+            stream (bool) - If true, return as soon as the header lines have arrived and parse
+                rows while they are downloaded. Use response.iter_rows() to consume them.
+        Returns:
+            JmaIrradiationResponse
+        """
+        return self._get_irradiation('hourly', start_date, end_date, stations, lta, stream)
+
+    def _get_irradiation(self, resolution, start_date, end_date, stations, lta, stream=False, elements=None):
+        if stream:
+            if self.cache is not None:
+                raise ValueError('Streamed responses cannot be cached')
+            return self._download_stream(resolution, start_date, end_date, stations, lta, elements)
+        if self.cache is None:
+            return self._download(resolution, start_date, end_date, stations, lta, self.kwh, self.date_type,
+                                  elements)
+        stations = list(stations)
+        for s, e in self.cache.missing_ranges(resolution, start_date, end_date, stations, lta, elements):
+            response = self._download(resolution, s, e, stations, lta, kwh=False, date_type='iso',
+                                      elements=elements)
+            self.cache.store(resolution, stations, response, lta, elements)
+        return self.cache.load(RESPONSE_CLASSES[resolution], resolution, start_date, end_date,
+                               stations, lta, kwh=self.kwh, date_type=self.date_type, elements=elements,
+                               columnar=self.columnar)
+
+    def _download(self, resolution, start_date, end_date, stations, lta, kwh, date_type, elements=None):
+        if self.coalescer is None:
+            return self._download_now(resolution, start_date, end_date, stations, lta, kwh, date_type, elements)
+        stations = list(stations)
+        key = (resolution, tuple(stations), lta, tuple(elements) if elements is not None else None,
+               kwh, date_type)
+        response, shared = self.coalescer.run(
+            key, start_date, end_date,
+            lambda: self._download_now(resolution, start_date, end_date, stations, lta, kwh, date_type, elements))
+        if shared:
+            return response.slice(start_date, end_date)
+        return response
+
+    def _download_now(self, resolution, start_date, end_date, stations, lta, kwh, date_type, elements=None):
+        metrics = RequestMetrics(resolution)
+
+        def attempt(sid):
+            params = build_params(resolution, start_date, end_date, stations, lta, sid, elements)
+            res = self._send_request(params, metrics=metrics)
+            text = self._decode(res, metrics)
+            response = RESPONSE_CLASSES[resolution](text, kwh=kwh, columnar=self.columnar, date_type=date_type)
+            metrics.parse_time = response.parse_time
+            metrics.rows = response.row_count
+            return response
+        return self._with_session(attempt, metrics)
+
+    def _download_stream(self, resolution, start_date, end_date, stations, lta, elements=None):
+        """Only the POST and the header lines are measured, since rows are parsed later"""
+        metrics = RequestMetrics(resolution)
+
+        def attempt(sid):
+            params = build_params(resolution, start_date, end_date, stations, lta, sid, elements)
+            res = self._send_request(params, stream=True, metrics=metrics)
+            chunks = res.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+            first = next(chunks, b'')
+            try:
+                # the HTML page starts with its <head>, so the first chunk is enough to recognize it
+                raise_if_html(first.decode('shift-jis', errors='replace'))
+                response = RESPONSE_CLASSES[resolution].stream(itertools.chain([first], chunks), kwh=self.kwh,
+                                                               encoding='shift-jis', date_type=self.date_type)
+            except BadCsvException:
+                res.close()
+                logger.exception(f'POST request failed. Request body: {res.request.body}')
+                raise
+            metrics.parse_time = response.parse_time
+            return response
+        return self._with_session(attempt, metrics)
+
+    def tail(self, stations, interval=600, lookback_days=1, today=None, sleep=time.sleep):
+        """Poll recent hourly irradiation and yield only what changed since the previous poll.
+        Every station column keeps a high-water mark (its last hour with a value), and each poll
+        only requests the days from the oldest mark to today. Rows are remembered by a hash of
+        their values until they fall out of that window, so unchanged rows are never yielded
+        again. Hours that JMA lists without any value yet are skipped until they get one.
+        Failed polls are logged and retried after the interval. The generator never ends by itself.
+        Args:
+            stations (List[JmaStation]) - Iterable of JmaStation
+            interval (float) - Seconds to wait between polls
+            lookback_days (int) - Number of days before today that the first poll covers, and the
+                furthest back any poll goes
+            today (Callable[[], datetime.date]) - Current date in Japan. Defaults to the system clock.
+            sleep (Callable[[float], None]) - Used to wait between polls
+        Yields:
+            JmaHourlyIrradiationResponse - The new or changed rows of a poll. Polls without changes
+                yield nothing.
+        """
+        stations = list(stations)
+        from requests.exceptions import RequestException
+        if today is None:
+            today = jst_today
+        marks = {} # header -> wall time seconds of the last hour with a value
+        seen = {} # Date -> (wall time seconds, hash of the row's values)
+        while True:
+            end_date = today()
+            start_date = end_date - timedelta(days=lookback_days)
+            if marks and len(marks) == len(stations):
+                oldest = (EPOCH + timedelta(seconds=min(marks.values()))).date()
+                start_date = max(start_date, oldest)
+            try:
+                response = self.get_hourly_irradiation(start_date, end_date, stations)
+            except (JmaException, RequestException):
+                logger.exception('Tail poll failed')
+                sleep(interval)
+                continue
+
+            headers = response.headers[1:]
+            changed = []
+            for row in response.iter_rows():
+                values = tuple(row[hdr] for hdr in headers)
+                digest = hash(values)
+                previous = seen.get(row['Date'])
+                if previous is None and all(v is None for v in values):
+                    continue # not observed yet
+                if previous is not None and previous[1] == digest:
+                    continue
+                ts = response._wall_seconds(row['Date'])
+                seen[row['Date']] = (ts, digest)
+                changed.append(row)
+                for hdr, v in zip(headers, values):
+                    if v is not None:
+                        marks[hdr] = max(ts, marks.get(hdr, ts))
+            window_start = (datetime.combine(start_date, datetime.min.time()) - EPOCH) // timedelta(seconds=1)
+            for key in [k for k, (ts, _) in seen.items() if ts < window_start]:
+                del seen[key]
+
+            if changed:
+                yield type(response).from_rows(response.headers, changed, kwh=response.convert_to_kwh,
+                                               columnar=self.columnar, date_type=response.date_type,
+                                               stations=response.stations, elements=response.elements,
+                                               lta_flags=response.lta_flags)
+            sleep(interval)
+
+    def get_irradiation(self, start_date, end_date, stations, resolution='daily', lta=False,
+                        max_workers=MAX_WORKERS, max_cells=MAX_CELLS, elements=None):
+        """Download irradiation data for an arbitrarily long date range and any number of stations.
+        The request is split into as few portal-sized requests as possible (see plan_requests),
+        and the partial results are merged back into a single response aligned on Date.
+        Args:
+            start_date (datetime.date) - First date for which irradiation data will be downloaded
+            end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
+            stations (List[JmaStation]) - Iterable of JmaStation
+            resolution (str) - 'daily' or 'hourly'
+            lta (bool) - True if long-term average irradation should be included in results
+            max_workers (int) - Maximum number of requests in flight at once
+            max_cells (int) - Maximum number of CSV cells per request
+            elements (List[JmaElement]) - Elements to download. Defaults to global irradiation only.
         Returns:
             JmaIrradiationResponse
         """
-        date_arr = [
-            start_date.year,
-            end_date.year,
-            start_date.month,
-            end_date.month,
-            start_date.day,
-            end_date.day,
-        ]
-        opts = '[["op1",0]]' if lta else []
-        params = {
-            'stationNumList':       encode_list_for_jma([stn.value for stn in stations]),
-            'aggrgPeriod':          9,
-            'elementNumList':       '[["610",""]]',
-            'interAnnualFlag':      1,
-            'ymdList':             	encode_list_for_jma(date_arr),
-            'optionNumList':        opts,
-            'downloadFlag':         True,
-            'rmkFlag':              0,
-            'disconnectFlag':       0,
-            'youbiFlag':            0,
-            'fukenFlag':            0,
-            'kijiFlag':             0,
-            'huukouFlag':           0,
-            'csvFlag':              0,
-            'jikantaiFlag':         0,
-            'jikantaiList':         '[1,24]',
-            'ymdLiteral':           1,
-            'PHPSESSID':            self.php_sessid,
-        }
-        res = self._send_request(params)
-        return JmaHourlyIrradiationResponse(res.text, kwh=self.kwh)
+        queries = plan_requests(start_date, end_date, stations, resolution, lta, max_cells, elements)
+        if not queries:
+            raise ValueError('Empty date range or station list')
+        results = self.get_many(queries, max_workers=max_workers)
+        for result in results:
+            if result.error is not None:
+                raise result.error
+        return merge_responses([result.response for result in results])
+
+    def get_many(self, queries, max_workers=MAX_WORKERS):
+        """Run several queries concurrently over the client's shared session.
+        Args:
+            queries (List[JmaQuery]) - Queries, or tuples of
+                (resolution, start_date, end_date, stations[, lta[, elements]])
+            max_workers (int) - Maximum number of requests in flight at once
+        Returns:
+            List[JmaResult] - One result per query, in the same order as the input.
+                A failed query does not abort the batch; its error is stored in the result.
+        """
+        queries = [self._validate_query(q) for q in queries]
+        results = [None] * len(queries)
+        for i, result in self._run_many(queries, max_workers):
+            results[i] = result
+        return results
+
+    def iter_many(self, queries, max_workers=MAX_WORKERS):
+        """Same as get_many, but yields each JmaResult as soon as its request completes.
+        Results are therefore not guaranteed to be in input order.
+        """
+        queries = [self._validate_query(q) for q in queries]
+        for _, result in self._run_many(queries, max_workers):
+            yield result
+
+    def _run_many(self, queries, max_workers):
+        if not queries:
+            return
+        max_workers = max(1, min(max_workers, len(queries)))
+        self._ensure_pool_size(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(self._run_query, q): i for i, q in enumerate(queries)}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # when the consumer stops early, queries that have not started are not sent
+                for future in futures:
+                    future.cancel()
+
+    def _run_query(self, query):
+        try:
+            if query.elements is None:
+                fetch = {
+                    'daily': self.get_daily_irradiation,
+                    'hourly': self.get_hourly_irradiation,
+                }[query.resolution]
+                response = fetch(query.start_date, query.end_date, query.stations, lta=query.lta)
+            else:
+                fetch = {
+                    'daily': self.get_daily_observations,
+                    'hourly': self.get_hourly_observations,
+                }[query.resolution]
+                response = fetch(query.start_date, query.end_date, query.stations, query.elements, lta=query.lta)
+        except Exception as e:
+            logger.exception(f'Query failed: {query}')
+            return JmaResult(query, None, e)
+        return JmaResult(query, response, None)
+
+    @staticmethod
+    def _validate_query(query):
+        query = JmaQuery(*query)
+        if query.resolution not in AGGREGATION_PERIODS:
+            raise ValueError(f'Unknown resolution: {query.resolution}')
+        return query
+
+
+def jst_today():
+    """Current date in Japan"""
+    return datetime.now(timezone(timedelta(seconds=JST_OFFSET))).date()
+
+
+def plan_requests(start_date, end_date, stations, resolution='daily', lta=False, max_cells=MAX_CELLS,
+                  elements=None):
+    """Split a download into the fewest queries that each fit within max_cells.
+    Stations are packed into equally sized groups and the date range into equally sized
+    windows. Every combination of group size and window length is evaluated, and the
+    one that needs the fewest requests wins.
+
+    Args:
+        start_date (datetime.date) - First date to download
+        end_date (datetime.date) - Last date (inclusive) to download
+        stations (List[JmaStation]) - Iterable of JmaStation
+        resolution (str) - 'daily' or 'hourly'
+        lta (bool) - True if long-term averages will be requested (doubles the column count)
+        max_cells (int) - Maximum number of CSV cells per request
+        elements (List[JmaElement]) - Elements to download (each one adds a column per station).
+            Defaults to global irradiation only.
+    Returns:
+        List[JmaQuery]
+    """
+    if resolution not in PERIODS_PER_DAY:
+        raise ValueError(f'Unknown resolution: {resolution}')
+    stations = list(stations)
+    n_days = (end_date - start_date).days + 1
+    if n_days < 1 or not stations:
+        return []
+    if elements is not None:
+        elements = list(elements)
+    columns_per_station = len(elements or [JmaElement.GlobalIrradiation]) * (2 if lta else 1)
+    cells_per_station_day = PERIODS_PER_DAY[resolution] * columns_per_station
+
+    best = None # (request count, stations per request, days per request)
+    for group_size in range(1, len(stations) + 1):
+        days = min(n_days, max_cells // (group_size * cells_per_station_day))
+        if days < 1:
+            break
+        count = math.ceil(len(stations) / group_size) * math.ceil(n_days / days)
+        if best is None or count < best[0]:
+            best = (count, group_size, days)
+    if best is None:
+        raise ValueError(f'A single station-day does not fit in {max_cells} cells')
+
+    _, group_size, days = best
+    n_groups = math.ceil(len(stations) / group_size)
+    n_windows = math.ceil(n_days / days)
+    group_size = math.ceil(len(stations) / n_groups) # balance group sizes
+    days = math.ceil(n_days / n_windows) # balance window lengths
+
+    queries = []
+    for g in range(0, len(stations), group_size):
+        group = stations[g:g+group_size]
+        for d in range(0, n_days, days):
+            s = start_date + timedelta(days=d)
+            e = min(end_date, s + timedelta(days=days-1))
+            queries.append(JmaQuery(resolution, s, e, group, lta, elements))
+    return queries
+
+
+def build_params(resolution, start_date, end_date, stations, lta, php_sessid, elements=None):
+    """Build the form body of a table.html request.
+    Args:
+        resolution (str) - 'daily' or 'hourly'
+        start_date (datetime.date) - First date for which irradiation data will be downloaded
+        end_date (datetime.date) - Last date (inclusive) for which irradiation data will be downloaded
+        stations (List[JmaStation]) - Iterable of JmaStation
+        lta (bool) - True if long-term average irradation should be included in results
+        php_sessid (str) - PHP Session ID scraped from index.php
+        elements (List[JmaElement]) - Elements to download. Defaults to global irradiation only.
+    Returns:
+        dict
+    """
+    date_arr = [
+        start_date.year,
+        end_date.year,
+        start_date.month,
+        end_date.month,
+        start_date.day,
+        end_date.day,
+    ]
+    opts = '[["op1",0]]' if lta else []
+    elements = elements or [JmaElement.GlobalIrradiation]
+    return {
+        'stationNumList':       encode_list_for_jma([stn.value for stn in stations]),
+        'aggrgPeriod':          AGGREGATION_PERIODS[resolution],
+        'elementNumList':       encode_elements(elements),
+        'interAnnualFlag':      1,
+        'ymdList':              encode_list_for_jma(date_arr),
+        'optionNumList':        opts,
+        'downloadFlag':         True,
+        'rmkFlag':              0,
+        'disconnectFlag':       0,
+        'youbiFlag':            0,
+        'fukenFlag':            0,
+        'kijiFlag':             0,
+        'huukouFlag':           0,
+        'csvFlag':              0,
+        'jikantaiFlag':         0,
+        'jikantaiList':         '[1,24]' if resolution == 'hourly' else [],
+        'ymdLiteral':           1,
+        'PHPSESSID':            php_sessid,
+    }
+
+
+def request_headers(base_url=BASE_URL):
+    """HTTP headers that make a table.html request look like it came from the portal's own page"""
+    origin = '{0.scheme}://{0.netloc}'.format(urlsplit(base_url))
+    return {
+        'Host':               urlsplit(base_url).netloc,
+        'User-Agent':         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:84.0) Gecko/20100101 Firefox/84.0',
+        'Accept':             'text/html, */*; q=0.01',
+        'Accept-Language':    'en-US,en;q=0.5',
+        'Accept-Encoding':    'gzip, deflate, br',
+        'Content-Type':       'application/x-www-form-urlencoded; charset=UTF-8',
+        'Origin':             origin,
+        'DNT':                '1',
+        'Connection':         'keep-alive',
+        'Referer':            base_url + 'index.php',
+    }
 
 
 def encode_list_for_jma(seq) -> str:
@@ -185,4 +657,4 @@ def extract_php_sessid(html: str):
 
 def raise_if_html(text: str):
     if '<head>' in text or '<body' in text:
-        raise BadCsvException('Is HTML page')
+        raise HtmlPageException('Is HTML page')
@@ -0,0 +1,71 @@
+"""Single-flight deduplication of concurrent downloads.
+
+When a download is requested while another one for the same resolution, stations and
+options is already in flight, and the in-flight one covers the requested date range,
+no second POST is sent. The caller waits for the first download to finish and receives
+its parsed result, sliced to the dates it asked for.
+"""
+import threading
+
+
+class _Call():
+    def __init__(self, key, start_date, end_date):
+        self.key = key
+        self.start_date = start_date
+        self.end_date = end_date
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def covers(self, key, start_date, end_date):
+        return self.key == key and self.start_date <= start_date and end_date <= self.end_date
+
+
+class RequestCoalescer():
+    """Tracks in-flight downloads. Thread safe; normally owned by a JmaClient."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.shared = 0 # number of downloads answered by another caller's request
+
+    def run(self, key, start_date, end_date, fetch):
+        """Call fetch(), unless an in-flight call with the same key covers the date range,
+        in which case its result is awaited instead.
+        Args:
+            key (Hashable) - Everything other than the date range that identifies the request
+            start_date (datetime.date) - First date of the request
+            end_date (datetime.date) - Last date (inclusive) of the request
+            fetch (Callable[[], object]) - Performs the download
+        Returns:
+            Tuple[object, bool] - The result, and True if it came from another caller's
+                request (and may therefore cover more dates than requested)
+        Raises:
+            Exception - whatever fetch raised, in the caller and in every waiter
+        """
+        with self.lock:
+            for call in self.calls:
+                if call.covers(key, start_date, end_date):
+                    self.shared += 1
+                    break
+            else:
+                call = None
+                own = _Call(key, start_date, end_date)
+                self.calls.append(own)
+
+        if call is not None:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            own.result = fetch()
+            return own.result, False
+        except BaseException as e:
+            own.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.remove(own)
+            own.done.set()
@@ -0,0 +1,49 @@
+from enum import Enum
+
+class JmaElement(Enum):
+    """Observation elements. The values are the element numbers of the elementNumList
+    form field. Like station ids, further elements can be found by inspecting the request
+    parameters of a CSV download from the portal."""
+    GlobalIrradiation =  '610' # 全天日射量 (MJ/m2)
+    SunshineDuration =   '401' # 日照時間 (hours)
+    AirTemperature =     '201' # 気温 (daily: mean) (°C)
+    Precipitation =      '101' # 降水量 (mm)
+    WindSpeed =          '301' # 風速 (daily: mean) (m/s)
+    RelativeHumidity =   '501' # 相対湿度 (daily: mean) (%)
+
+
+# Text that identifies each element on the second header line of the CSV
+element_headers = [
+    ('日射量', JmaElement.GlobalIrradiation),
+    ('日照時間', JmaElement.SunshineDuration),
+    ('気温', JmaElement.AirTemperature),
+    ('降水量', JmaElement.Precipitation),
+    ('風速', JmaElement.WindSpeed),
+    ('湿度', JmaElement.RelativeHumidity),
+]
+
+
+def element_from_header(text: str):
+    """
+    Args:
+        text (str) - Element header, e.g. '合計全天日射量(MJ/㎡)'
+    Returns:
+        JmaElement - or None if the element is not known
+    """
+    for fragment, element in element_headers:
+        if fragment in text:
+            return element
+    return None
+
+
+LTA_SUFFIX = '_LT' # element key suffix of long-term averages, e.g. '610_LT'
+
+
+def element_key(element, lta=False) -> str:
+    """Key that identifies the values or the long-term averages of an element in local storage"""
+    return element.value + (LTA_SUFFIX if lta else '')
+
+
+def encode_elements(elements) -> str:
+    """Encode elements for the elementNumList form field, e.g. '[["610",""],["401",""]]'"""
+    return '[' + ','.join(f'["{e.value}",""]' for e in elements) + ']'
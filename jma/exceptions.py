@@ -8,3 +8,8 @@ class NoSessionIdException(JmaException):
 
 class BadCsvException(JmaException):
     pass
+
+
+class HtmlPageException(BadCsvException):
+    """JMA answered with its HTML page instead of CSV, e.g. because the session expired"""
+    pass
@@ -1,6 +1,11 @@
 from enum import Enum
 
+from jma.stations import get_catalog
+
+
 class JmaStation(Enum):
+    """Stations of the bundled catalog (see jma.stations). JmaStation.info holds the name,
+    prefecture and coordinates of a station."""
     Akita =      's47582' # akita
     Aomori =     's47575' # aomori
     Fukuoka =    's47807' # fukuoka
@@ -9,7 +14,8 @@ class JmaStation(Enum):
     Kagoshima =  's47827' # kagoshima
     Kumamoto =   's47819' # kumamoto
     Matsue =     's47741' # shimane
-    Miyakazki =  's47830' # miyazaki
+    Miyazaki =   's47830' # miyazaki
+    Miyakazki =  's47830' # alias of Miyazaki, kept for backward compatibility
     Morioka =    's47584' # iwate
     Nagano =     's47610' # nagano
     Nagasaki =   's47817' # nagasaki
@@ -25,7 +31,7 @@ class JmaStation(Enum):
     Yamagata =   's47588' # yamagata
 
     # These sites don't have irradiation data
-    Aburatsu =   's47835' # okinawa
+    Aburatsu =   's47835' # miyazaki
     Fuji =       'a0442' # shizuoka
     Fujisan =    's47639' # shizuoka
     Fukaura =    's47574' # aomori
@@ -34,23 +40,32 @@ class JmaStation(Enum):
     Hachinohe =  's47581' # aomori
     Hamada =     's47755' # shimane
     Hamamatsu =  's47654' # shizuoka
-    Himeji =     's47769' # gunma
+    Himeji =     's47769' # hyogo
     Hitoyoshi =  's47824' # kumamoto
-    Ibukiksan =  's47751' # shiga
+    Ibukiyama =  's47751' # shiga
+    Ibukiksan =  's47751' # alias of Ibukiyama, kept for backward compatibility
     Ishinomaki = 's47592' # miyagi
-    Kobe =       's47770' # gunma
+    Kobe =       's47770' # hyogo
     Maibara =    'a1524' # shiga
     Nago =       's47940' # okinawa
     Nobeoka =    's47822' # miyazaki
     Okayama =    's47768' # okayama
     Owase =      's47663' # mie
     Sakata =     's47587' # yamagata
-    Sumoto =     's47776' # gunma
+    Sumoto =     's47776' # hyogo
     Takayama =   's47617' # gifu
     Tottori =    's47746' # tottori
-    Toyooka =    's47747' # gunma
+    Toyooka =    's47747' # hyogo
     Tsu =        's47651' # mie
     Tsuyama =    's47756' # okayama
     Ueno =       's47649' # mie
     Yamaguchi =  's47784' # yamaguchi
     Yokkaichi =  's47684' # mie
+
+    @property
+    def info(self):
+        """
+        Returns:
+            jma.stations.StationInfo - Catalog entry of the station
+        """
+        return get_catalog().get(self.value)
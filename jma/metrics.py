@@ -0,0 +1,88 @@
+"""Instrumentation of JmaClient requests.
+
+Pass an observer to JmaClient to receive a RequestMetrics after every download:
+
+    def observer(metrics):
+        print(metrics.resolution, metrics.post_time, metrics.parse_time, metrics.rows)
+
+    with JmaClient(observer=observer) as c:
+        ...
+
+PrometheusObserver exports the same information through prometheus_client.
+"""
+
+
+class RequestMetrics():
+    """Timings and counters of a single download. Times are in seconds.
+    Fields that do not apply (e.g. bootstrap_time when the session id was already known,
+    or rows for a streamed response) are left at None."""
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.bootstrap_time = None # GET index.php to obtain a PHP Session ID
+        self.post_time = None # POST table.html until the body has been received
+        self.status = None # HTTP status of the last POST
+        self.response_bytes = None
+        self.decode_time = None # Shift-JIS bytes -> str
+        self.parse_time = None # str -> JmaIrradiationResponse
+        self.rows = None
+        self.retries = 0 # requests repeated after a session refresh or by the scheduler
+        self.total_time = None
+        self.error = None # exception that ended the download, if any
+
+    def add_bootstrap_time(self, seconds):
+        self.bootstrap_time = (self.bootstrap_time or 0) + seconds
+
+    def __repr__(self):
+        fields = ', '.join(f'{k}={v!r}' for k, v in vars(self).items())
+        return f'RequestMetrics({fields})'
+
+
+class PrometheusObserver():
+    """Observer that records RequestMetrics with prometheus_client.
+    Requires the optional prometheus_client dependency.
+
+    Exported metrics (all labelled by resolution):
+        jma_request_phase_seconds{phase} - histogram of bootstrap/post/decode/parse/total times
+        jma_requests_total{outcome} - downloads, by 'ok' or exception class name
+        jma_response_bytes_total
+        jma_rows_total
+        jma_retries_total
+    """
+
+    PHASES = ('bootstrap', 'post', 'decode', 'parse', 'total')
+
+    def __init__(self, registry=None, namespace='jma'):
+        """
+        Args:
+            registry (prometheus_client.CollectorRegistry) - Defaults to the global registry
+            namespace (str) - Prefix of the metric names
+        """
+        try:
+            import prometheus_client as prom
+        except ImportError:
+            raise ImportError('PrometheusObserver requires prometheus_client: pip install jma-client[prometheus]')
+        if registry is None:
+            registry = prom.REGISTRY
+        kwargs = {'namespace': namespace, 'registry': registry}
+        self.phase_seconds = prom.Histogram('request_phase_seconds', 'Time spent per request phase',
+                                            ['resolution', 'phase'], **kwargs)
+        self.requests = prom.Counter('requests_total', 'Downloads by outcome', ['resolution', 'outcome'], **kwargs)
+        self.response_bytes = prom.Counter('response_bytes_total', 'Bytes received', ['resolution'], **kwargs)
+        self.rows = prom.Counter('rows_total', 'Rows parsed', ['resolution'], **kwargs)
+        self.retries = prom.Counter('retries_total', 'Requests repeated', ['resolution'], **kwargs)
+
+    def __call__(self, metrics):
+        resolution = metrics.resolution
+        for phase in self.PHASES:
+            seconds = getattr(metrics, phase + '_time')
+            if seconds is not None:
+                self.phase_seconds.labels(resolution, phase).observe(seconds)
+        outcome = 'ok' if metrics.error is None else type(metrics.error).__name__
+        self.requests.labels(resolution, outcome).inc()
+        if metrics.response_bytes:
+            self.response_bytes.labels(resolution).inc(metrics.response_bytes)
+        if metrics.rows:
+            self.rows.labels(resolution).inc(metrics.rows)
+        if metrics.retries:
+            self.retries.labels(resolution).inc(metrics.retries)
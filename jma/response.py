@@ -1,6 +1,20 @@
-from datetime import datetime, time
+from array import array
+from bisect import bisect_left
+import codecs
+from datetime import datetime, time, timedelta
+from time import perf_counter
 
+from jma.elements import JmaElement, element_from_header, element_key
 from jma.exceptions import BadCsvException
+from jma.rows import row_class
+from jma.stations import station_name_en
+
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+JST_OFFSET = 9 * 3600 # seconds. JMA timestamps are in Japan Standard Time (UTC+9)
+
+# Representations of the Date column
+DATE_TYPES = ('iso', 'datetime', 'epoch')
 
 def try_cast_float(val):
     try:
@@ -9,23 +23,402 @@ def try_cast_float(val):
         return None
 
 class JmaIrradiationResponse():
-    def __init__(self, csv_data: str, kwh=False):
+
+    DATE_FORMAT = '%Y-%m-%d'
+
+    STEP = timedelta(days=1) # interval between consecutive rows
+
+    def __init__(self, csv_data: str = None, kwh=False, columnar=False, date_type='iso'):
         """
         Args:
-            csv_data (str) - CSV data returned from JMA
+            csv_data (str) - CSV data returned from JMA. If None, an empty response is created.
             kwh (bool) - If true MJ/m2 values will be converted to kWh/m2
+            columnar (bool) - If true, data is stored as one typed array per header instead
+                of a dict per row. Missing values are stored as NaN. The csv attribute is then
+                built on first access.
+            date_type (str) - Type of the Date values in rows: 'iso' for ISO formatted strings,
+                'datetime' for naive datetimes in JST, or 'epoch' for Unix timestamps (int seconds)
         """
+        if date_type not in DATE_TYPES:
+            raise ValueError(f'Unknown date_type: {date_type}')
         self.headers = []
         self.csv = []
+        self.stations = [] # station name of each column after Date
+        self.elements = [] # JmaElement (or None if unknown) of each column after Date
+        self.lta_flags = [] # whether each column after Date holds long-term averages
+        self._kwh_columns = [] # whether each column after Date is converted to kWh/m2
         self.convert_to_kwh = kwh
+        self.columnar = columnar
+        self.date_type = date_type
+        self.timestamps = array('q') if columnar else None # seconds since 1970-01-01 (JST wall time)
+        self.columns = None # {header: array('d')}, created once all header lines have been read
+        self._pending = None # data lines not parsed yet, for streamed responses
+        self._next_text = None # predicted timestamp text of the next row
+        self._next_dt = None
+        self._row_class = None # JmaRow subclass of the headers, created with the first row
+        self.parse_time = None # seconds spent parsing csv_data
+        if columnar:
+            self.csv = None
+        if csv_data is None:
+            return
+        t = perf_counter()
         try:
-            csv_data = csv_data.replace('\r', '') # CRLF -> LF
-            self._parse(csv_data)
+            self._parse(split_lines(csv_data))
         except:
             raise BadCsvException(csv_data)
+        self.parse_time = perf_counter() - t
+
+    @classmethod
+    def stream(cls, chunks, kwh=False, encoding='shift-jis', date_type='iso'):
+        """Parse CSV data incrementally as it is downloaded.
+        The header lines are read immediately, so headers are available as soon as this
+        returns. Data rows are only parsed when iter_rows is called, and are not stored.
+        Args:
+            chunks (Iterable[bytes]) - Raw body of the JMA response
+            kwh (bool) - If true MJ/m2 values will be converted to kWh/m2
+            encoding (str) - Encoding of the body
+            date_type (str) - 'iso', 'datetime' or 'epoch'
+        Returns:
+            JmaIrradiationResponse
+        """
+        response = cls(kwh=kwh, date_type=date_type)
+        t = perf_counter()
+        response._pending = response._iter_data_lines(iter_lines(chunks, encoding))
+        try:
+            first = next(response._pending, None) # consumes all header lines
+        except Exception as e:
+            raise BadCsvException(str(e))
+        if first is not None:
+            response._pending = _prepend(first, response._pending)
+        response.parse_time = perf_counter() - t
+        return response
+
+    @property
+    def row_count(self):
+        """Number of rows, or None for a streamed response"""
+        if self._pending is not None:
+            return None
+        if self.columnar and self._rows is None:
+            return len(self.timestamps)
+        return len(self.csv)
+
+    def iter_rows(self):
+        """Iterate over the rows of the response, each a dict keyed by header.
+        For a streamed response, rows are parsed one at a time as the body arrives
+        and can only be iterated once."""
+        if self._pending is None:
+            if self._rows is None and self.columnar:
+                # build rows one at a time rather than materializing the csv view
+                yield from self._iter_column_rows()
+            else:
+                yield from self.csv
+            return
+        pending, self._pending = self._pending, iter(())
+        for i, line in pending:
+            try:
+                row = self._build_row(line)
+            except Exception:
+                raise BadCsvException(line)
+            yield row
+
+    @classmethod
+    def from_rows(cls, headers, rows, kwh=False, columnar=False, date_type='iso', stations=None,
+                  elements=None, lta_flags=None):
+        """Build a response from already parsed data.
+        Args:
+            headers (List[str]) - Column names, starting with 'Date'
+            rows (List[dict]) - Rows keyed by header
+            kwh (bool) - True if the values in rows are expressed in kWh/m2
+            columnar (bool) - If true, the rows are converted to typed arrays
+            date_type (str) - Type of the Date values in rows
+            stations (List[str]) - Station name of each column after Date. Defaults to the header.
+            elements (List[JmaElement]) - Element of each column after Date. Defaults to None (unknown).
+            lta_flags (List[bool]) - Whether each column after Date holds long-term averages.
+                Defaults to whether the header ends with _LT.
+        """
+        response = cls(kwh=kwh, date_type=date_type)
+        response.headers = list(headers)
+        if not columnar:
+            row = response._get_row_class()
+            rows = [r if type(r) is row else row(tuple(r[h] for h in response.headers)) for r in rows]
+        names = response.headers[1:]
+        response.stations = list(stations) if stations is not None else [h.replace('_LT', '') for h in names]
+        response.elements = list(elements) if elements is not None else [None] * len(names)
+        response.lta_flags = list(lta_flags) if lta_flags is not None else [h.endswith('_LT') for h in names]
+        response._kwh_columns = [e in (None, JmaElement.GlobalIrradiation) for e in response.elements]
+        response.csv = list(rows)
+        if columnar:
+            response.timestamps, response.columns = response._columns_from_rows()
+            response.columnar = True
+            response.csv = None
+        return response
+
+    @property
+    def csv(self):
+        """List of rows, each a dict keyed by header"""
+        if self._rows is None and self.columnar:
+            self._rows = self._rows_from_columns()
+        return self._rows
+
+    @csv.setter
+    def csv(self, rows):
+        self._rows = rows
+
+    def _to_row_mode(self):
+        """Replace the typed columns of a columnar response with rows"""
+        self.csv = self._rows_from_columns()
+        self.columnar = False
+        self.timestamps = None
+        self.columns = None
+
+    def __getstate__(self):
+        if self._pending is not None:
+            raise TypeError('A streamed response cannot be pickled')
+        state = self.__dict__.copy()
+        state['_row_class'] = None # created at runtime; rebuilt from the headers when needed
+        return state
+
+    def _rows_from_columns(self):
+        return list(self._iter_column_rows())
+
+    def _iter_column_rows(self):
+        row = self._get_row_class()
+        columns = [self.columns[hdr] for hdr in self.headers[1:]] if self.columns else []
+        for i, ts in enumerate(self.timestamps):
+            values = [self._date_value(EPOCH + timedelta(seconds=ts))]
+            for col in columns:
+                val = col[i]
+                values.append(None if val != val else val) # NaN -> None
+            yield row(tuple(values))
+
+    def _get_row_class(self):
+        if self._row_class is None:
+            self._row_class = row_class(tuple(self.headers))
+            self.headers = list(self._row_class.headers) # interned
+        return self._row_class
+
+    def _columns_from_rows(self):
+        timestamps = array('q', (self._wall_seconds(row['Date']) for row in self.csv))
+        columns = {}
+        for hdr in self.headers[1:]:
+            columns[hdr] = array('d', (float('nan') if row[hdr] is None else row[hdr] for row in self.csv))
+        return timestamps, columns
+
+    def _get_columns(self):
+        """Typed columns of the response. Shared with the response in columnar mode,
+        and built from the rows otherwise."""
+        if self.columnar:
+            if self.columns is None:
+                self.columns = {hdr: array('d') for hdr in self.headers[1:]}
+            return self.timestamps, self.columns
+        return self._columns_from_rows()
+
+    def to_numpy(self):
+        """Export the data as NumPy arrays. In columnar mode the arrays share memory with the response.
+        Returns:
+            Dict[str, numpy.ndarray] - 'Date' maps to a datetime64[s] array, every other
+                header to a float64 array with NaN for missing values
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError('to_numpy requires numpy: pip install jma-client[numpy]')
+        timestamps, columns = self._get_columns()
+        out = {'Date': np.frombuffer(timestamps, dtype=np.int64).view('datetime64[s]')}
+        for hdr in self.headers[1:]:
+            out[hdr] = np.frombuffer(columns[hdr], dtype=np.float64)
+        return out
+
+    def to_pandas(self):
+        """Export the data as a pandas DataFrame indexed by Date.
+        Returns:
+            pandas.DataFrame
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError('to_pandas requires pandas: pip install jma-client[pandas]')
+        arrays = self.to_numpy()
+        index = pd.DatetimeIndex(arrays.pop('Date'), name='Date')
+        return pd.DataFrame(arrays, index=index, columns=self.headers[1:], copy=False)
+
+    def to_arrow(self):
+        """Export the data as a pyarrow Table. In columnar mode the table wraps the response's
+        buffers without copying them. Missing values are kept as NaN.
+        Returns:
+            pyarrow.Table
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError('to_arrow requires pyarrow: pip install jma-client[arrow]')
+        timestamps, columns = self._get_columns()
+        n = len(timestamps)
+        arrays = [pa.Array.from_buffers(pa.timestamp('s'), n, [None, pa.py_buffer(timestamps)])]
+        for hdr in self.headers[1:]:
+            arrays.append(pa.Array.from_buffers(pa.float64(), n, [None, pa.py_buffer(columns[hdr])]))
+        return pa.Table.from_arrays(arrays, names=list(self.headers))
+
+    def series(self, lta=False):
+        """Values keyed by (station, element), in row order.
+        Args:
+            lta (bool) - If true, return the long-term average columns instead
+        Returns:
+            Dict[Tuple[str, JmaElement], List[float]]
+        """
+        out = {}
+        for hdr, station, element, is_lta in zip(self.headers[1:], self.stations, self.elements, self.lta_flags):
+            if is_lta == lta:
+                out[(station, element)] = [row[hdr] for row in self.csv]
+        return out
+
+    def column_keys(self, stations, elements=None):
+        """Identify the station and element of every column after Date.
+        Args:
+            stations (List[JmaStation]) - Stations in the order they were requested. JMA names
+                each station on the first header line, in the same order.
+            elements (List[JmaElement]) - Requested elements. Defaults to global irradiation.
+        Returns:
+            List[Tuple[str, str]] - Station id and element key (see jma.elements.element_key) of each column
+        Raises:
+            ValueError - if the columns do not match the stations or elements
+        """
+        stations = list(stations)
+        elements = list(elements or [JmaElement.GlobalIrradiation])
+        names = []
+        for name in self.stations:
+            if name not in names:
+                names.append(name)
+        if len(names) != len(stations):
+            raise ValueError(f'Columns {self.headers} do not match stations {stations}')
+        ids = dict(zip(names, (stn.value for stn in stations)))
+        keys = []
+        for name, element, is_lta in zip(self.stations, self.elements, self.lta_flags):
+            if element is None and len(elements) == 1:
+                element = elements[0]
+            if element is None:
+                raise ValueError(f'Unknown element in {self.headers}')
+            keys.append((ids[name], element_key(element, is_lta)))
+        return keys
+
+    def slice(self, start_date, end_date):
+        """Copy of the response restricted to the rows of a date range.
+        Args:
+            start_date (datetime.date) - First date to keep
+            end_date (datetime.date) - Last date (inclusive) to keep
+        Returns:
+            JmaIrradiationResponse - Of the same class, units and storage mode
+        """
+        lo = (datetime.combine(start_date, time()) - EPOCH) // ONE_SECOND
+        hi = (datetime.combine(end_date + timedelta(days=1), time()) - EPOCH) // ONE_SECOND
+        out = type(self)(kwh=self.convert_to_kwh, columnar=self.columnar, date_type=self.date_type)
+        out.headers = list(self.headers)
+        out.stations = list(self.stations)
+        out.elements = list(self.elements)
+        out.lta_flags = list(self.lta_flags)
+        out._kwh_columns = list(self._kwh_columns)
+        if self.columnar:
+            # timestamps are in chronological order
+            i = bisect_left(self.timestamps, lo)
+            j = bisect_left(self.timestamps, hi)
+            out.timestamps = self.timestamps[i:j]
+            out.columns = {hdr: col[i:j] for hdr, col in self.columns.items()} if self.columns else None
+            out.csv = None
+        else:
+            # rows are immutable, so they are shared with this response
+            out.csv = [row for row in self.csv if lo <= self._wall_seconds(row['Date']) < hi]
+        return out
+
+    def resample(self, period='daily', how='sum', min_coverage=0.0):
+        """Aggregate rows into longer periods.
+        Periods start at 00:00 JST; since hourly timestamps already mark the start of each
+        hour (see JmaHourlyIrradiationResponse.parse_jp_date), 24時 counts towards the day it ends.
+        Args:
+            period (str or datetime.timedelta) - 'daily', 'monthly', or a custom window length
+                such as timedelta(hours=6). Windows are aligned on 1970-01-01 00:00 JST.
+            how (str) - 'sum', 'mean', 'max', or 'coverage' for the fraction of the rows of each
+                period that have a value (missing rows count as missing values)
+            min_coverage (float) - Periods whose coverage is lower are set to None.
+                Ignored for how='coverage'. Periods without any value are always None.
+        Returns:
+            JmaIrradiationResponse - Daily and monthly periods are dated by their first day.
+                Custom windows return a JmaHourlyIrradiationResponse dated by their first hour.
+                The storage mode, units and date_type are those of this response.
+        """
+        if how not in AGGREGATIONS:
+            raise ValueError(f'Unknown aggregation: {how}')
+        step = self.STEP // ONE_SECOND
+        if period == 'daily':
+            bucket = _fixed_buckets(86400)
+            out_class = JmaIrradiationResponse
+        elif period == 'monthly':
+            bucket = _month_buckets()
+            out_class = JmaIrradiationResponse
+        elif isinstance(period, timedelta) and period >= self.STEP:
+            bucket = _fixed_buckets(period // ONE_SECOND)
+            out_class = JmaHourlyIrradiationResponse
+        else:
+            raise ValueError(f'Unknown period: {period}')
 
-    def _parse(self, csv_data: str):
-        for i, line in enumerate(csv_data.split("\n")):
+        timestamps, columns = self._get_columns()
+        starts = {} # period start -> index of the period in the output
+        expected = [] # number of rows in each period
+        index = array('q', bytes(8 * len(timestamps))) # period index of each row
+        for i, ts in enumerate(timestamps):
+            start, length = bucket(ts)
+            j = starts.get(start)
+            if j is None:
+                j = starts[start] = len(expected)
+                expected.append(length // step)
+            index[i] = j
+        # timestamps are normally in chronological order, but merged responses need not be
+        order = sorted(range(len(expected)), key=list(starts).__getitem__)
+
+        out = out_class(kwh=self.convert_to_kwh, columnar=True, date_type=self.date_type)
+        out.headers = list(self.headers)
+        out.stations = list(self.stations)
+        out.elements = list(self.elements)
+        out.lta_flags = list(self.lta_flags)
+        out._kwh_columns = list(self._kwh_columns)
+        out.timestamps = array('q', sorted(starts))
+        out.columns = {}
+        nan = float('nan')
+        n = len(expected)
+        for hdr in self.headers[1:]:
+            totals = [0.0] * n
+            counts = [0] * n
+            maxes = [nan] * n
+            for j, x in zip(index, columns[hdr]):
+                if x == x: # not NaN
+                    totals[j] += x
+                    counts[j] += 1
+                    if not x <= maxes[j]: # also true while maxes[j] is NaN
+                        maxes[j] = x
+            values = array('d')
+            for j in order:
+                coverage = counts[j] / expected[j]
+                if how == 'coverage':
+                    values.append(coverage)
+                elif counts[j] == 0 or coverage < min_coverage:
+                    values.append(nan)
+                elif how == 'sum':
+                    values.append(totals[j])
+                elif how == 'mean':
+                    values.append(totals[j] / counts[j])
+                else:
+                    values.append(maxes[j])
+            out.columns[hdr] = values
+        if not self.columnar:
+            out._to_row_mode()
+        return out
+
+    def _parse(self, lines):
+        for i, line in self._iter_data_lines(lines):
+            self._handle_data(i, line)
+
+    def _iter_data_lines(self, lines):
+        """Validate the preamble and handle header lines. Data lines are passed on."""
+        for i, line in enumerate(lines):
             if i <= 1:
                 self._validate_line(i, line)
             elif len(line) < 1:
@@ -33,7 +426,7 @@ class JmaIrradiationResponse():
             elif line[0] not in '0123456789':
                 self._handle_headers(i, line)
             else:
-                self._handle_data(i, line)
+                yield i, line
     
     def _validate_line(self, i: int, line: str):
         if i == 0:
@@ -55,14 +448,32 @@ class JmaIrradiationResponse():
         ,山口,山口,松江,松江
         ,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
         ,,平年値(MJ/㎡),,平年値(MJ/㎡)
+
+        When several elements are requested, the second line identifies the element of each
+        column, and the element name is appended to the headers (e.g. Fukuoka_SunshineDuration):
+        ,福岡,福岡
+        ,合計全天日射量(MJ/㎡),日照時間(時間)
         """
         split = line.split(',')
         if i == 2:
-            self.headers = ['Date'] + [station_jp_to_en.get(h, h) for h in split[1:]]
-        else:
+            self.stations = [station_name_en(h) for h in split[1:]]
+            self.headers = ['Date'] + self.stations
+            self.elements = [None] * len(self.stations)
+            self.lta_flags = [False] * len(self.stations)
+            self._kwh_columns = [True] * len(self.stations)
+        elif i == 3:
+            self.elements = [element_from_header(h) for h in split[1:]]
+            # only irradiation is measured in MJ/m2; unknown elements are assumed to be irradiation
+            self._kwh_columns = [e in (None, JmaElement.GlobalIrradiation) for e in self.elements]
+            if len(set(self.elements)) > 1:
+                for j, element in enumerate(self.elements, 1):
+                    if element is not None:
+                        self.headers[j] += '_' + element.name
+        if i > 2:
             for j, data_type in enumerate(split):
                 if '平年値' in data_type:
                     self.headers[j] += '_LT' # Long Term Average
+                    self.lta_flags[j-1] = True
     
     def _handle_data(self, i: int, line:str):
         """
@@ -73,29 +484,95 @@ class JmaIrradiationResponse():
             return
         if line[0] not in '0123456789': # all data rows should start with a year (Ex: 2021年)
             return
+        if self.columnar:
+            split = line.split(',')
+            self._append_columns(split[0], split[1:])
+            return
+        self.csv.append(self._build_row(line))
+
+    def _build_row(self, line: str):
         split = line.split(',')
         timestamp, values = split[0], split[1:]
-        timestamp = self.jp_date_to_iso(timestamp)
+        timestamp = self._date_value(self.jp_date_to_datetime(timestamp))
         values = [try_cast_float(v) for v in values]
         if self.convert_to_kwh:
             # 3.6 MJ/m2 = 1 kWh/m2
-            values =  [x/3.6 if x is not None else None for x in values]
-        data = [timestamp] + values
-        row = dict()
-        for i, val in enumerate(data):
-            hdr = self.headers[i]
-            row[hdr] = val
-        self.csv.append(row)
+            values =  [x/3.6 if x is not None and kwh else x for x, kwh in zip(values, self._kwh_columns)]
+        row = self._get_row_class()
+        if len(values) != len(row.headers) - 1:
+            raise ValueError(f'Expected {len(row.headers) - 1} values: {line}')
+        return row((timestamp, *values))
+
+    def _append_columns(self, timestamp: str, values):
+        if len(values) != len(self.headers) - 1:
+            raise ValueError(f'Expected {len(self.headers) - 1} values: {timestamp},{",".join(values)}')
+        _, columns = self._get_columns()
+        dt = self.jp_date_to_datetime(timestamp)
+        self.timestamps.append((dt - EPOCH) // ONE_SECOND)
+        for hdr, v, kwh in zip(self.headers[1:], values, self._kwh_columns):
+            x = try_cast_float(v)
+            if x is None:
+                x = float('nan')
+            elif self.convert_to_kwh and kwh:
+                x = x/3.6 # 3.6 MJ/m2 = 1 kWh/m2
+            columns[hdr].append(x)
+
+    def jp_date_to_datetime(self, text: str):
+        """Convert a JMA timestamp to datetime.
+        Rows arrive in chronological order at a fixed interval, so the text of the next
+        timestamp is predicted from the current one. Strict parsing is only needed for the
+        first row and whenever the sequence breaks."""
+        if text == self._next_text:
+            dt = self._next_dt
+        else:
+            dt = self.parse_jp_date(text)
+        self._next_dt = dt + self.STEP
+        self._next_text = self.format_jp_date(self._next_dt)
+        return dt
 
     def jp_date_to_iso(self, text: str):
         """Convert Japanese dates in the format 'yyyy年mm月dd日' to ISO format"""
-        dt = datetime.strptime(text, '%Y年%m月%d日')
-        return dt.strftime('%Y-%m-%d')
+        return self.format_iso(self.jp_date_to_datetime(text))
+
+    def parse_jp_date(self, text: str):
+        """Strictly parse Japanese dates in the format 'yyyy年mm月dd日'"""
+        return datetime.strptime(text, '%Y年%m月%d日')
+
+    def format_jp_date(self, dt: datetime):
+        """Inverse of parse_jp_date"""
+        return f'{dt.year}年{dt.month}月{dt.day}日'
+
+    def format_iso(self, dt: datetime):
+        return f'{dt.year:04}-{dt.month:02}-{dt.day:02}'
+
+    def _date_value(self, dt: datetime):
+        """Represent a parsed timestamp according to date_type"""
+        if self.date_type == 'iso':
+            return self.format_iso(dt)
+        if self.date_type == 'datetime':
+            return dt
+        return (dt - EPOCH) // ONE_SECOND - JST_OFFSET
+
+    def _wall_seconds(self, value):
+        """Inverse of _date_value, in seconds since 1970-01-01 00:00 JST wall time"""
+        if isinstance(value, str):
+            value = datetime.strptime(value, self.DATE_FORMAT)
+        if isinstance(value, datetime):
+            return (value - EPOCH) // ONE_SECOND
+        return value + JST_OFFSET
 
 
 class JmaHourlyIrradiationResponse(JmaIrradiationResponse):
+
+    DATE_FORMAT = '%Y-%m-%d %H:%M'
+    STEP = timedelta(hours=1)
+
     def jp_date_to_iso(self, text:str):
         """Convert Japanese dates in the format yyyy年mm月dd日H時 to ISO format"""
+        return self.format_iso(self.jp_date_to_datetime(text))
+
+    def parse_jp_date(self, text:str):
+        """Strictly parse Japanese dates in the format yyyy年mm月dd日H時"""
         split = text.split('日')
         date = datetime.strptime(split[0], '%Y年%m月%d')
         if len(split) > 1 and '時' in split[1]:
@@ -108,26 +585,114 @@ class JmaHourlyIrradiationResponse(JmaIrradiationResponse):
         else:
             hr = 0
         t = time(hr, 0)
-        dt = datetime.combine(date, t)
-        return dt.strftime('%Y-%m-%d %H:%M')
-
-station_jp_to_en = {
-    '秋田': 'Akita',
-    '青森': 'Aomori',
-    '福岡': 'Fukuoka',
-    '広島': 'Hiroshima',
-    '鹿児島': 'Kagoshima',
-    '熊本': 'Kumamoto',
-    '松江': 'Matsue',
-    '宮崎': 'Miyazaki',
-    '盛岡': 'Morioka',
-    '長野': 'Nagano',
-    '長崎': 'Nagasaki',
-    '名古屋': 'Nagoya',
-    '那覇': 'Naha',
-    '大分': 'Oita',
-    '佐賀': 'Saga',
-    '札幌': 'Sapporo',
-    '仙台': 'Sendai',
-    '山形': 'Yamagata',
-}
+        return datetime.combine(date, t)
+
+    def format_jp_date(self, dt: datetime):
+        """Inverse of parse_jp_date: hour 23 of a day is written as 24時 of that day"""
+        return f'{dt.year}年{dt.month}月{dt.day}日{dt.hour + 1}時'
+
+    def format_iso(self, dt: datetime):
+        return f'{dt.year:04}-{dt.month:02}-{dt.day:02} {dt.hour:02}:{dt.minute:02}'
+
+    def to_daily(self, min_coverage=0.0):
+        """Daily totals computed from the hourly values, as get_daily_irradiation would return
+        them, without downloading them again.
+        Args:
+            min_coverage (float) - Days with a lower fraction of hours present are set to None
+        Returns:
+            JmaIrradiationResponse
+        """
+        return self.resample('daily', 'sum', min_coverage)
+
+
+AGGREGATIONS = ('sum', 'mean', 'max', 'coverage')
+
+
+def _fixed_buckets(seconds):
+    def bucket(ts):
+        return ts - ts % seconds, seconds
+    return bucket
+
+
+def _month_buckets():
+    days = {} # day number -> (start of month, length of month), both in seconds
+    def bucket(ts):
+        day = ts // 86400
+        found = days.get(day)
+        if found is None:
+            d = EPOCH + timedelta(days=day)
+            start = datetime(d.year, d.month, 1)
+            end = datetime(d.year + d.month // 12, d.month % 12 + 1, 1)
+            found = days[day] = ((start - EPOCH) // ONE_SECOND, (end - start) // ONE_SECOND)
+        return found
+    return bucket
+
+
+def split_lines(text: str):
+    """Iterate over the lines of text without copying it as a whole. CRLF and LF are both accepted."""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            break
+        yield text[start:end].rstrip('\r')
+        start = end + 1
+    yield text[start:].rstrip('\r')
+
+
+def iter_lines(chunks, encoding='shift-jis'):
+    """Decode a byte stream chunk by chunk and yield its lines (without line terminators).
+    Multi-byte characters split across chunk boundaries are handled by the incremental decoder.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    tail = ''
+    for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    yield tail + decoder.decode(b'', final=True)
+
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+
+def merge_responses(responses):
+    """Stitch responses for disjoint stations and/or date ranges into a single response.
+    Rows are aligned on their Date and sorted chronologically. Cells that none of the
+    responses provide are set to None.
+
+    Args:
+        responses (List[JmaIrradiationResponse]) - Responses of the same class and units
+    Returns:
+        JmaIrradiationResponse
+    """
+    if not responses:
+        raise ValueError('Nothing to merge')
+    headers = ['Date']
+    info = {} # header -> (station, element, lta)
+    for response in responses:
+        for hdr, *column in zip(response.headers[1:], response.stations, response.elements, response.lta_flags):
+            if hdr not in info:
+                headers.append(hdr)
+                info[hdr] = column
+    position = {h: i for i, h in enumerate(headers)}
+    by_date = {}
+    for response in responses:
+        positions = [position[h] for h in response.headers]
+        for row in response.csv:
+            merged = by_date.get(row['Date'])
+            if merged is None:
+                merged = by_date[row['Date']] = [None] * len(headers)
+            for p, h in zip(positions, response.headers):
+                merged[p] = row[h]
+    row = row_class(tuple(headers))
+    rows = [row(tuple(by_date[k])) for k in sorted(by_date)]
+    first = responses[0]
+    stations, elements, lta_flags = zip(*[info[h] for h in headers[1:]]) if info else ((), (), ())
+    return type(first).from_rows(headers, rows, kwh=first.convert_to_kwh, columnar=first.columnar,
+                                 date_type=first.date_type, stations=stations, elements=elements,
+                                 lta_flags=lta_flags)
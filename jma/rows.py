@@ -0,0 +1,74 @@
+"""Compact rows for the row oriented API of JmaIrradiationResponse.
+
+A row is a read-only mapping from header to value. Instead of a hash table per row,
+every row holds a tuple of values, and the header -> position map lives on a class that
+is shared by all rows with the same headers:
+
+    row['Fukuoka'], row.get('Saga'), dict(row), list(row.items())
+"""
+from collections.abc import Mapping
+from functools import lru_cache
+import sys
+
+
+class JmaRow(Mapping):
+    """Base class of the row classes created by row_class"""
+
+    __slots__ = ('_values',)
+
+    headers = () # interned header strings, set on subclasses
+    _index = {} # header -> position in _values, set on subclasses
+
+    def __init__(self, values):
+        """
+        Args:
+            values (tuple) - One value per header, in header order
+        """
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self.headers)
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def values(self):
+        """Values in header order"""
+        return self._values
+
+    def __eq__(self, other):
+        if isinstance(other, JmaRow) and other.headers == self.headers:
+            return self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+    def __reduce__(self):
+        # row classes are created at runtime, so they are rebuilt from the headers when unpickled
+        return (make_row, (self.headers, self._values))
+
+
+@lru_cache(maxsize=256)
+def row_class(headers):
+    """
+    Args:
+        headers (Tuple[str]) - Column names, starting with 'Date'
+    Returns:
+        type - A subclass of JmaRow for these headers. Identical headers share a class.
+    """
+    headers = tuple(sys.intern(h) for h in headers)
+    index = {h: i for i, h in enumerate(headers)}
+    return type('JmaRow', (JmaRow,), {'__slots__': (), 'headers': headers, '_index': index})
+
+
+def make_row(headers, values):
+    return row_class(tuple(headers))(tuple(values))
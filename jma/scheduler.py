@@ -0,0 +1,141 @@
+"""Rate limiting, adaptive concurrency and retries for bulk downloads.
+
+A RequestScheduler can be shared by any number of JmaClient instances and threads:
+
+    scheduler = RequestScheduler(rate=2)
+    with JmaClient(scheduler=scheduler) as c:
+        c.get_many(queries, max_workers=8)
+
+Every POST first takes a token from a token bucket (which caps the sustained request
+rate) and then a slot under the concurrency limit. The limit grows by about one request
+per round trip while responses are fast and successful, and halves on timeouts,
+connection errors, 429/5xx responses, slow responses and HTML-instead-of-CSV replies
+(additive increase, multiplicative decrease). Failed requests are retried with jittered
+exponential backoff.
+"""
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('jmaclient')
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RequestScheduler():
+
+    def __init__(self, rate=2.0, burst=4, max_concurrency=8, initial_concurrency=2, latency_target=2.0,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0, sleep=time.sleep, rng=random.random):
+        """
+        Args:
+            rate (float) - Sustained number of requests per second
+            burst (int) - Number of requests that may be sent back to back after an idle period
+            max_concurrency (int) - Upper bound of the adaptive concurrency limit
+            initial_concurrency (int) - Concurrency limit to start from
+            latency_target (float) - Responses slower than this many seconds count as congestion
+            max_retries (int) - Number of times a failed request is repeated
+            backoff_base (float) - Backoff before the first retry is drawn from [0, backoff_base) seconds,
+                and the upper bound doubles on each subsequent retry
+            backoff_max (float) - Upper bound of any single backoff
+            sleep (Callable[[float], None]) - Used to wait between retries
+            rng (Callable[[], float]) - Returns a random number in [0, 1)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.rng = rng
+        self.limit = float(initial_concurrency) # adaptive concurrency limit
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.cond = threading.Condition()
+
+    def run(self, send, on_retry=None):
+        """Send a request under the rate and concurrency limits, retrying it on failure.
+        Args:
+            send (Callable[[], requests.Response]) - Sends the request
+            on_retry (Callable[[], None]) - Called before each retry
+        Returns:
+            requests.Response - The first successful response, or the last failed one
+                once the retries are exhausted
+        Raises:
+            requests.exceptions.Timeout, requests.exceptions.ConnectionError - if the
+                last attempt failed with one of these
+        """
+        import requests
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            self._acquire()
+            start = time.monotonic()
+            try:
+                res = send()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                self._release(healthy=False)
+                if last:
+                    raise
+                logger.warning(f'Request failed ({e!r}); retrying')
+            except BaseException:
+                self._release(healthy=None)
+                raise
+            else:
+                if res.status_code not in RETRY_STATUSES:
+                    self._release(healthy=time.monotonic() - start <= self.latency_target)
+                    return res
+                self._release(healthy=False)
+                if last:
+                    return res
+                logger.warning(f'Request failed with HTTP {res.status_code}; retrying')
+                res.close()
+            self.sleep(self.backoff(attempt))
+            if on_retry is not None:
+                on_retry()
+
+    def backoff(self, attempt):
+        """Full jitter: a random delay between 0 and base * 2**attempt, capped at backoff_max"""
+        return self.rng() * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+
+    def report_overload(self):
+        """Signal congestion noticed after a request completed, such as an HTML reply"""
+        with self.cond:
+            self._decrease()
+
+    def _acquire(self):
+        with self.cond:
+            while True:
+                self._refill()
+                if self.in_flight < int(self.limit) and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                if self.tokens < 1:
+                    timeout = (1 - self.tokens) / self.rate
+                else:
+                    timeout = None # wait for a slot to be released
+                self.cond.wait(timeout)
+
+    def _release(self, healthy):
+        """
+        Args:
+            healthy (bool) - True to ramp up, False to back off, None to leave the limit unchanged
+        """
+        with self.cond:
+            self.in_flight -= 1
+            if healthy:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif healthy is not None:
+                self._decrease()
+            self.cond.notify_all()
+
+    def _decrease(self):
+        self.limit = max(1.0, self.limit / 2)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
@@ -0,0 +1,93 @@
+"""Stores that let several JmaClient instances share a PHP Session ID.
+
+The portal's session id is scraped from index.php, which costs a full round trip.
+A store keeps it around, with an expiry, so that the next client (in the same process
+for MemorySessionStore, or in any process for FileSessionStore) can skip that request.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+# PHP discards idle sessions after 24 minutes by default
+MAX_AGE = 20 * 60 # seconds
+
+
+class MemorySessionStore():
+    """Share a session id between clients in the same process"""
+
+    def __init__(self, max_age=MAX_AGE):
+        """
+        Args:
+            max_age (float) - Number of seconds a session id is considered valid
+        """
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self._sid = None
+        self._expires = 0
+
+    def get(self):
+        """
+        Returns:
+            str - Stored session id, or None if there is none or it has expired
+        """
+        with self.lock:
+            if self._sid is None or time.time() >= self._expires:
+                return None
+            return self._sid
+
+    def set(self, sid):
+        with self.lock:
+            self._sid = sid
+            self._expires = time.time() + self.max_age
+
+    def clear(self):
+        with self.lock:
+            self._sid = None
+
+
+class FileSessionStore():
+    """Share a session id between processes through a small JSON file"""
+
+    def __init__(self, path, max_age=MAX_AGE):
+        """
+        Args:
+            path (str) - Location of the JSON file
+            max_age (float) - Number of seconds a session id is considered valid
+        """
+        self.path = path
+        self.max_age = max_age
+
+    def get(self):
+        """
+        Returns:
+            str - Stored session id, or None if there is none or it has expired
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if time.time() >= data['expires']:
+                return None
+            return data['sid']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, sid):
+        data = {'sid': sid, 'expires': time.time() + self.max_age}
+        # write to a temporary file first so that readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,177 @@
+"""Catalog of JMA observation stations.
+
+The catalog is bundled with the package (jma/data/stations.csv) and read on first use.
+Lookups by id, Japanese name and English name are dictionary lookups, and nearest station
+queries go through a k-d tree, so mapping many sites to their closest station stays cheap:
+
+    catalog = get_catalog()
+    catalog.get_by_name_jp('彦根').name_en # 'Hikone'
+    for info, km in catalog.nearest(35.0, 135.9, k=2):
+        station = JmaStation(info.id)
+
+Every station of the catalog is a member of JmaStation, and JmaStation.info returns its entry.
+"""
+from collections import namedtuple
+import csv
+from functools import lru_cache
+import heapq
+import io
+import math
+import pkgutil
+
+EARTH_RADIUS = 6371.0 # km
+
+StationInfo = namedtuple('StationInfo', ['id', 'name_jp', 'name_en', 'prefecture', 'latitude', 'longitude',
+                                         'irradiation'])
+StationInfo.__doc__ = """An entry of the station catalog.
+    id (str) - Station id used by the JMA portal, e.g. 's47807'
+    name_jp (str) - Name used by JMA in CSV headers, e.g. '福岡'
+    name_en (str) - English name, used as header by JmaIrradiationResponse
+    prefecture (str) - English name of the prefecture
+    latitude (float) - Degrees north
+    longitude (float) - Degrees east
+    irradiation (bool) - True if the station observes global irradiation
+"""
+
+
+class StationCatalog():
+
+    def __init__(self, stations):
+        """
+        Args:
+            stations (Iterable[StationInfo]) - Entries of the catalog
+        """
+        self.stations = list(stations)
+        self._indexes = None
+        self._trees = {}
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def get(self, station_id):
+        """
+        Returns:
+            StationInfo - Entry with this id, or None if there is none
+        """
+        return self._get_indexes()[0].get(station_id)
+
+    def get_by_name_jp(self, name):
+        """
+        Returns:
+            StationInfo - Entry with this Japanese name, or None if there is none
+        """
+        return self._get_indexes()[1].get(name)
+
+    def get_by_name_en(self, name):
+        """
+        Returns:
+            StationInfo - Entry with this English name, or None if there is none
+        """
+        return self._get_indexes()[2].get(name)
+
+    def nearest(self, latitude, longitude, k=1, irradiation=True):
+        """Stations closest to a location, by great-circle distance.
+        Args:
+            latitude (float) - Degrees north
+            longitude (float) - Degrees east
+            k (int) - Number of stations to return
+            irradiation (bool) - If true, only consider stations that observe irradiation
+        Returns:
+            List[Tuple[StationInfo, float]] - Up to k stations and their distance in km, closest first
+        """
+        if irradiation not in self._trees:
+            stations = [s for s in self.stations if s.irradiation or not irradiation]
+            self._trees[irradiation] = (stations, _build_tree([(_unit_vector(s.latitude, s.longitude), i)
+                                                               for i, s in enumerate(stations)]))
+        stations, tree = self._trees[irradiation]
+        heap = []
+        if k > 0:
+            _search_tree(tree, _unit_vector(latitude, longitude), k, heap)
+        found = sorted((-d, i) for d, i in heap)
+        return [(stations[i], 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(d) / 2))) for d, i in found]
+
+    def _get_indexes(self):
+        if self._indexes is None:
+            self._indexes = (
+                {s.id: s for s in self.stations},
+                {s.name_jp: s for s in self.stations},
+                {s.name_en: s for s in self.stations},
+            )
+        return self._indexes
+
+
+def load_catalog(path=None):
+    """Read a station catalog.
+    Args:
+        path (str) - CSV file with the columns of StationInfo. Defaults to the bundled catalog.
+    Returns:
+        StationCatalog
+    """
+    if path is None:
+        text = pkgutil.get_data('jma', 'data/stations.csv').decode('utf-8')
+    else:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+    stations = []
+    for row in csv.DictReader(io.StringIO(text)):
+        stations.append(StationInfo(row['id'], row['name_jp'], row['name_en'], row['prefecture'],
+                                    float(row['latitude']), float(row['longitude']), row['irradiation'] == '1'))
+    return StationCatalog(stations)
+
+
+@lru_cache(maxsize=None)
+def get_catalog():
+    """
+    Returns:
+        StationCatalog - The bundled catalog, loaded on first call
+    """
+    return load_catalog()
+
+
+def station_name_en(name_jp):
+    """English name of a station, or name_jp itself if the station is not in the catalog"""
+    info = get_catalog().get_by_name_jp(name_jp)
+    return name_jp if info is None else info.name_en
+
+
+def _unit_vector(latitude, longitude):
+    # Euclidean distance between unit vectors grows with great-circle distance, so a plain k-d tree works
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _build_tree(items, depth=0):
+    """
+    Args:
+        items (List[Tuple[Tuple[float, float, float], int]]) - Points and their position in the station list
+    Returns:
+        tuple - (point, position, axis, left subtree, right subtree), or None if items is empty
+    """
+    if not items:
+        return None
+    axis = depth % 3
+    items = sorted(items, key=lambda item: item[0][axis])
+    mid = len(items) // 2
+    point, i = items[mid]
+    return (point, i, axis, _build_tree(items[:mid], depth + 1), _build_tree(items[mid + 1:], depth + 1))
+
+
+def _search_tree(node, target, k, heap):
+    """Collect the k points closest to target in heap, as (-squared distance, position)"""
+    if node is None:
+        return
+    point, i, axis, left, right = node
+    d = sum((a - b) ** 2 for a, b in zip(point, target))
+    if len(heap) < k:
+        heapq.heappush(heap, (-d, i))
+    elif d < -heap[0][0]:
+        heapq.heapreplace(heap, (-d, i))
+    diff = target[axis] - point[axis]
+    near, far = (left, right) if diff < 0 else (right, left)
+    _search_tree(near, target, k, heap)
+    if len(heap) < k or diff * diff < -heap[0][0]:
+        _search_tree(far, target, k, heap)
@@ -0,0 +1,206 @@
+"""Memory-mapped storage of station time series.
+
+Every (resolution, station, element) series is kept in its own fixed-width binary file:
+
+    <root>/<resolution>/<station id>/<element key>.bin, e.g. store/hourly/s47807/610.bin
+
+The file starts with a 32 byte header, followed by one float per period (hour or day)
+from the first stored period onwards. Timestamps are not stored: the timestamp of value i
+is base + i * step, where base and step are read from the header. Missing periods hold NaN.
+A date range therefore maps to a byte range with a single subtraction, and reads return
+memoryviews over the mapped file without copying or parsing anything:
+
+    with SeriesStore('store') as store:
+        store.append('hourly', stations, response)
+        window = store.read(JmaStation.Fukuoka, 'hourly', date(2001, 5, 1), date(2001, 5, 31))
+        values = numpy.frombuffer(window.values) # still zero-copy
+
+Like JmaCache, the store only accepts values in MJ/m2. Timestamps are JST wall time.
+"""
+from array import array
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from jma.elements import JmaElement, element_key
+
+MAGIC = b'JMAS'
+VERSION = 1
+HEADER = struct.Struct('<4sBcc1xqq8x') # magic, version, dtype, byte order, step, base
+STEPS = {
+    'daily': 86400, # seconds
+    'hourly': 3600,
+}
+EPOCH = datetime(1970, 1, 1)
+NAN = float('nan')
+
+SeriesSlice = namedtuple('SeriesSlice', ['start', 'step', 'values'])
+SeriesSlice.__doc__ = """A window of a stored series.
+    start (datetime.datetime) - Timestamp of the first value (JST), or None if the window is empty
+    step (datetime.timedelta) - Interval between consecutive values
+    values (memoryview) - Values in MJ/m2 (NaN if missing), backed by the mapped file
+"""
+
+
+class SeriesStore():
+
+    def __init__(self, root, dtype='d'):
+        """
+        Args:
+            root (str) - Directory of the store. It is created if necessary.
+            dtype (str) - 'd' to store new series as float64, or 'f' for float32.
+                Existing files keep the type they were created with.
+        """
+        if dtype not in ('d', 'f'):
+            raise ValueError(f'Unknown dtype: {dtype}')
+        self.root = root
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self._maps = {} # path -> (file size, mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, a, b, c):
+        self.close()
+
+    def close(self):
+        """Forget the mapped files. Maps stay open for as long as a memoryview returned
+        by read still refers to them."""
+        with self.lock:
+            self._maps.clear()
+
+    def path(self, station, resolution, element=JmaElement.GlobalIrradiation, lta=False):
+        return os.path.join(self.root, resolution, station.value, element_key(element, lta) + '.bin')
+
+    def append(self, resolution, stations, response, elements=None):
+        """Add the values of a response. Values already stored for the same periods are replaced,
+        and the series is extended backwards or forwards as needed.
+        Args:
+            resolution (str) - 'daily' or 'hourly'
+            stations (List[JmaStation]) - Stations in the order they were requested
+            response (JmaIrradiationResponse) - Response parsed without kWh conversion
+            elements (List[JmaElement]) - Requested elements. Defaults to global irradiation.
+        Returns:
+            int - Number of values written
+        """
+        if response.convert_to_kwh:
+            raise ValueError('Only MJ/m2 values can be stored')
+        step = STEPS[resolution]
+        timestamps, columns = response._get_columns()
+        if not len(timestamps):
+            return 0
+        written = 0
+        for (station, key), hdr in zip(response.column_keys(stations, elements), response.headers[1:]):
+            path = os.path.join(self.root, resolution, station, key + '.bin')
+            written += self._write(path, step, timestamps, columns[hdr])
+        return written
+
+    def read(self, station, resolution, start_date, end_date, element=JmaElement.GlobalIrradiation, lta=False):
+        """Values of a station between two dates.
+        Args:
+            station (JmaStation) - Station
+            resolution (str) - 'daily' or 'hourly'
+            start_date (datetime.date) - First date
+            end_date (datetime.date) - Last date (inclusive)
+            element (JmaElement) - Element
+            lta (bool) - True to read the long-term averages instead of the observations
+        Returns:
+            SeriesSlice - Clipped to the stored range
+        """
+        step = STEPS[resolution]
+        path = self.path(station, resolution, element, lta)
+        mm = self._map(path)
+        if mm is None:
+            return SeriesSlice(None, timedelta(seconds=step), memoryview(b'').cast('d'))
+        _, dtype, base = _read_header(mm[:HEADER.size])
+        size = struct.calcsize(dtype)
+        count = (len(mm) - HEADER.size) // size
+        lo = _wall_seconds(start_date)
+        hi = _wall_seconds(end_date + timedelta(days=1))
+        i = min(count, max(0, -(-(lo - base) // step))) # first period starting at or after lo
+        j = min(count, max(i, -(-(hi - base) // step)))
+        values = memoryview(mm)[HEADER.size + i * size:HEADER.size + j * size].cast(dtype)
+        start = EPOCH + timedelta(seconds=base + i * step) if j > i else None
+        return SeriesSlice(start, timedelta(seconds=step), values)
+
+    def _map(self, path):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            cached = self._maps.get(path)
+            if cached is not None and cached[0] == size:
+                return cached[1]
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # a map of the old size may still be referenced by earlier reads, so it is not closed here
+            self._maps[path] = (size, mm)
+            return mm
+
+    def _write(self, path, step, timestamps, values):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        first = min(timestamps)
+        with self.lock:
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(_header(self.dtype, step, first - first % step))
+            with open(path, 'rb') as f:
+                file_step, dtype, base = _read_header(f.read(HEADER.size))
+                if file_step != step:
+                    raise ValueError(f'{path} holds a series with a step of {file_step} seconds')
+                if first < base:
+                    # Extend the series backwards. The file is replaced rather than rewritten in place,
+                    # so that views returned by earlier reads keep pointing at the old data.
+                    shift = -(-(base - first) // step)
+                    base -= shift * step
+                    tmp = path + '.tmp'
+                    with open(tmp, 'wb') as out:
+                        out.write(_header(dtype, step, base))
+                        out.write(array(dtype, [NAN]) * shift)
+                        out.write(f.read())
+                    os.replace(tmp, path)
+
+            with open(path, 'r+b') as f:
+                size = struct.calcsize(dtype)
+                count = (os.fstat(f.fileno()).st_size - HEADER.size) // size
+                positions = [(ts - base) // step for ts in timestamps]
+                lo = min(min(positions), count) # gaps past the end of the file are filled with NaN
+                hi = max(positions) + 1
+                f.seek(HEADER.size + lo * size)
+                buf = array(dtype)
+                buf.frombytes(f.read((min(hi, count) - lo) * size))
+                buf.extend(array(dtype, [NAN]) * (hi - lo - len(buf)))
+                for p, x in zip(positions, values):
+                    buf[p - lo] = x
+                f.seek(HEADER.size + lo * size)
+                f.write(buf.tobytes())
+        return len(positions)
+
+
+def _header(dtype, step, base):
+    byteorder = b'<' if sys.byteorder == 'little' else b'>'
+    return HEADER.pack(MAGIC, VERSION, dtype.encode(), byteorder, step, base)
+
+
+def _read_header(data):
+    """
+    Returns:
+        Tuple[int, str, int] - step in seconds, array typecode, timestamp of the first value
+    """
+    magic, version, dtype, byteorder, step, base = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a series file')
+    if byteorder != (b'<' if sys.byteorder == 'little' else b'>'):
+        raise ValueError('Series file was written on a machine with a different byte order')
+    return step, dtype.decode(), base
+
+
+def _wall_seconds(d):
+    """Seconds since 1970-01-01 00:00 JST wall time at the start of a date"""
+    return (datetime.combine(d, time()) - EPOCH) // timedelta(seconds=1)
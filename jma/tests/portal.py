@@ -0,0 +1,107 @@
+"""Local stand-in for the obsdl portal, used to test the clients without network access"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+INDEX_HTML = '''<html><head><title>obsdl</title></head>
+<body><input type="hidden" id="sid" value="{sid}" /></body></html>'''
+
+
+class MockPortal():
+    """Serves index.php with a session id and table.html with a fixed CSV payload.
+
+    Usage:
+        with MockPortal(csv_data) as portal:
+            with JmaClient(base_url=portal.base_url) as c:
+                ...
+    """
+
+    def __init__(self, csv_data='', sid='mock-sessid'):
+        """
+        Args:
+            csv_data (str or bytes) - CSV returned by table.html. Text is encoded as cp932
+                (Windows Shift-JIS) like the real portal; bytes are sent as they are.
+            sid (str) - PHP Session ID embedded in index.php
+        """
+        self.csv_data = csv_data
+        self.sid = sid
+        self.forms = [] # parsed form bodies of every table.html request
+        self.index_hits = 0
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency = 0 # seconds table.html waits before replying
+        self.check_sid = False # if true, table.html returns an HTML page unless PHPSESSID is sid
+        self.error_status = None # if set, table.html fails with this HTTP status
+        self.error_count = None # number of requests that fail with error_status; None for all
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, a, b, c):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.split('?')[0].endswith('index.php'):
+                    portal.index_hits += 1
+                    self._reply(INDEX_HTML.format(sid=portal.sid).encode('utf-8'), 'text/html; charset=UTF-8')
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True)
+                if not self.path.endswith('show/table.html'):
+                    self.send_error(404)
+                    return
+                with portal.lock:
+                    portal.forms.append(form)
+                    portal.in_flight += 1
+                    portal.max_in_flight = max(portal.max_in_flight, portal.in_flight)
+                try:
+                    time.sleep(portal.latency)
+                    if portal.error_status is not None and portal.error_count != 0:
+                        if portal.error_count is not None:
+                            portal.error_count -= 1
+                        self.send_error(portal.error_status)
+                    elif portal.check_sid and form.get('PHPSESSID') != [portal.sid]:
+                        self._reply(INDEX_HTML.format(sid=portal.sid).encode('utf-8'), 'text/html; charset=UTF-8')
+                    else:
+                        body = portal.csv_data
+                        if isinstance(body, str):
+                            body = body.encode('cp932')
+                        self._reply(body, 'text/csv; charset=Shift_JIS')
+                finally:
+                    with portal.lock:
+                        portal.in_flight -= 1
+
+        return Handler
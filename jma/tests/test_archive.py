@@ -0,0 +1,91 @@
+"""Test cases for archive re-parsing"""
+import csv
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from jma.archive import iter_archive, parse_archive, main
+from jma.exceptions import BadCsvException
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+2021年1月1日,2.53,6.95
+2021年1月2日,1.07,
+'''
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for name, text in [('a.csv', CSV_DATA), ('b.csv', CSV_DATA.replace('2021年1月', '2021年2月'))]:
+            self.files.append(self.write(name, text.encode('cp932')))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, 'archive', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_results_in_order(self):
+        bad = self.write('c.csv', b'<html><body>error</body></html>')
+        results = list(iter_archive(self.files + [bad], max_workers=2))
+        self.assertEqual(self.files + [bad], [r.path for r in results])
+        self.assertEqual('2021-02-01', results[1].response.csv[0]['Date'])
+        self.assertFalse(results[0].response.columnar)
+        self.assertIsNone(results[2].response)
+        self.assertIsNotNone(results[2].error)
+
+    def test_bounded_window(self):
+        submitted = []
+
+        class Pool(ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                submitted.append(args)
+                return super().submit(fn, *args)
+
+        with mock.patch('jma.archive.ProcessPoolExecutor', Pool):
+            results = iter_archive(self.files * 10, max_workers=2)
+            self.assertEqual(self.files[0], next(results).path)
+            self.assertEqual(4, len(submitted)) # 2 * max_workers files ahead of the consumer
+            self.assertEqual(20, len(list(results)) + 1)
+        self.assertEqual(20, len(submitted))
+
+    def test_errors_are_truncated(self):
+        bad = self.write('c.csv', b'garbage,' * 1000)
+        with self.assertLogs('jmaclient', 'ERROR') as logs:
+            result, = iter_archive([bad], max_workers=1)
+        self.assertIsInstance(result.error, BadCsvException)
+        self.assertLess(len(str(result.error)), 300)
+        self.assertLess(len(logs.output[0]), 500)
+
+    def test_cli_without_output(self):
+        bad = self.write('c.csv', b'garbage')
+        output = os.path.join(self.tmp.name, 'out.csv')
+        with self.assertLogs('jmaclient', 'ERROR') as logs:
+            self.assertEqual(1, main([bad, '--output', output, '--workers', '1']))
+        self.assertFalse(os.path.exists(output))
+        self.assertIn('no output was written', logs.output[-1])
+
+    def test_parse_archive(self):
+        merged = parse_archive(self.files, kwh=True, columnar=True, max_workers=2)
+        self.assertTrue(merged.columnar)
+        self.assertEqual(['Date', 'Fukuoka', 'Saga'], merged.headers)
+        self.assertEqual(4, merged.row_count)
+        self.assertAlmostEqual(6.95 / 3.6, merged.csv[2]['Saga'])
+
+    def test_cli(self):
+        output = os.path.join(self.tmp.name, 'out.csv')
+        self.assertEqual(0, main([os.path.join(self.tmp.name, 'archive'), '--output', output, '--workers', '2']))
+        with open(output, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(['Date', 'Fukuoka', 'Saga'], rows[0])
+        self.assertEqual(['2021-01-01', '2021-01-02', '2021-02-01', '2021-02-02'], [r[0] for r in rows[1:]])
@@ -0,0 +1,69 @@
+"""Test cases for the asyncio client"""
+import asyncio
+from datetime import date
+import unittest
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from jma.client import JmaClient
+from jma.jmastation import JmaStation
+from jma.tests.portal import MockPortal
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+2021年1月1日,2.53,6.95
+2021年1月2日,1.07,3.56
+'''
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncJmaClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.portal = MockPortal(CSV_DATA.replace('\n', '\r\n'))
+        self.portal.__enter__()
+
+    def tearDown(self):
+        self.portal.__exit__(None, None, None)
+
+    async def test_get_daily_irradiation(self):
+        from jma.asyncclient import AsyncJmaClient
+        async with AsyncJmaClient(base_url=self.portal.base_url) as c:
+            self.assertEqual('mock-sessid', c.php_sessid)
+            response = await c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 2),
+                                                     [JmaStation.Fukuoka, JmaStation.Saga])
+        self.assertListEqual(['Date', 'Fukuoka', 'Saga'], response.headers)
+        self.assertEqual('2021-01-02', response.csv[1]['Date'])
+        self.assertAlmostEqual(3.56, response.csv[1]['Saga'])
+
+    async def test_payload_matches_sync_client(self):
+        from jma.asyncclient import AsyncJmaClient
+        args = (date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka, JmaStation.Saga])
+        async with AsyncJmaClient(base_url=self.portal.base_url) as c:
+            await c.get_daily_irradiation(*args)
+            await c.get_hourly_irradiation(*args, lta=True)
+
+        def run_sync():
+            with JmaClient(base_url=self.portal.base_url) as c:
+                c.get_daily_irradiation(*args)
+                c.get_hourly_irradiation(*args, lta=True)
+        await asyncio.get_running_loop().run_in_executor(None, run_sync)
+
+        async_forms, sync_forms = self.portal.forms[:2], self.portal.forms[2:]
+        self.assertEqual(sync_forms, async_forms)
+        self.assertEqual(['["s47807","s47813"]'], async_forms[0]['stationNumList'])
+
+    async def test_concurrency_limit(self):
+        from jma.asyncclient import AsyncJmaClient
+        self.portal.latency = 0.05
+        async with AsyncJmaClient(base_url=self.portal.base_url, max_concurrency=2) as c:
+            tasks = [c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka])
+                     for _ in range(6)]
+            responses = await asyncio.gather(*tasks)
+        self.assertEqual(6, len(responses))
+        self.assertEqual(6, len(self.portal.forms))
+        self.assertLessEqual(self.portal.max_in_flight, 2)
@@ -0,0 +1,85 @@
+"""Test cases for the resumable backfill"""
+from datetime import date
+import json
+import os
+import tempfile
+import unittest
+
+from jma.backfill import Backfill, main, parse_stations
+from jma.client import JmaClient
+from jma.jmastation import JmaStation
+from jma.tests.portal import MockPortal
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡
+,合計全天日射量(MJ/㎡)
+2021年1月1日,2.53
+2021年1月2日,
+'''
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'out')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def backfill(self):
+        # 2 stations x 4 days with at most 2 cells per request -> 4 chunks
+        return Backfill(self.output, 'daily', date(2021, 1, 1), date(2021, 1, 4),
+                        [JmaStation.Fukuoka, JmaStation.Saga], max_cells=2)
+
+    def test_resume_after_failures(self):
+        with MockPortal(CSV_DATA) as portal:
+            portal.error_status = 500
+            portal.error_count = 2
+            with JmaClient(base_url=portal.base_url) as c:
+                failed = self.backfill().run(c, max_workers=1)
+            self.assertEqual(2, len(failed))
+            with open(os.path.join(self.output, 'manifest.json'), encoding='utf-8') as f:
+                self.assertEqual(2, len(json.load(f)['chunks']))
+
+            with JmaClient(base_url=portal.base_url) as c:
+                job = self.backfill()
+                self.assertEqual([], job.run(c, max_workers=1))
+            self.assertEqual(6, len(portal.forms)) # 4 on the first run, only the 2 failed ones on the second
+        self.assertEqual([], job.pending())
+        files = sorted(f for f in os.listdir(self.output) if f.endswith('.csv'))
+        self.assertEqual(4, len(files))
+        with open(os.path.join(self.output, files[0]), encoding='utf-8') as f:
+            self.assertEqual(['Date,Fukuoka', '2021-01-01,2.53', '2021-01-02,'], f.read().splitlines())
+
+    def test_different_job_is_refused(self):
+        with MockPortal(CSV_DATA) as portal:
+            argv = ['--stations', 'Fukuoka', '--start', '2021-01-01', '--end', '2021-01-02',
+                    '--output', self.output, '--base-url', portal.base_url]
+            self.assertEqual(0, main(argv))
+            self.assertEqual(1, main(argv + ['--kwh']))
+            self.assertEqual(0, main(argv)) # nothing left to download
+            self.assertEqual(1, len(portal.forms))
+
+    def test_all_stations(self):
+        with MockPortal(CSV_DATA) as portal:
+            argv = ['--stations', 'all', '--start', '2021-01-01', '--end', '2021-01-31',
+                    '--output', self.output, '--base-url', portal.base_url]
+            self.assertEqual(0, main(argv))
+            self.assertEqual(1, len(portal.forms))
+        with open(os.path.join(self.output, 'manifest.json'), encoding='utf-8') as f:
+            chunks = json.load(f)['chunks']
+        self.assertEqual(1, len(chunks))
+        key, chunk = chunks.popitem()
+        self.assertLess(len(chunk['file']), 64)
+        self.assertTrue(os.path.exists(os.path.join(self.output, chunk['file'])))
+        stations = chunk['chunk'].split(' ')[-1].split(',')
+        self.assertEqual([stn.name for stn in JmaStation if stn.info.irradiation], stations)
+
+    def test_parse_stations(self):
+        self.assertEqual([JmaStation.Fukuoka, JmaStation.Saga], parse_stations('Fukuoka,s47813'))
+        self.assertEqual(list(JmaStation), parse_stations('all'))
+        irradiation = parse_stations('all', irradiation=True)
+        self.assertIn(JmaStation.Niigata, irradiation)
+        self.assertNotIn(JmaStation.Kobe, irradiation)
+        self.assertTrue(all(stn.info.irradiation for stn in irradiation))
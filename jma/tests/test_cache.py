@@ -0,0 +1,141 @@
+"""Test cases for the observation cache"""
+from datetime import date
+import unittest
+
+from jma.cache import JmaCache
+from jma.client import JmaClient
+from jma.elements import JmaElement
+from jma.jmastation import JmaStation
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.tests.portal import MockPortal
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,福岡,佐賀,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+,,平年値(MJ/㎡),,平年値(MJ/㎡)
+2021年1月1日,2.53,6.0,6.95,6.5
+2021年1月2日,1.07,6.1,,6.6
+2021年1月3日,11.01,6.2,11.68,6.7
+'''
+
+STATIONS = [JmaStation.Fukuoka, JmaStation.Saga]
+
+
+class TestJmaCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = JmaCache(today=lambda: date(2021, 3, 1))
+
+    def test_everything_missing_when_empty(self):
+        ranges = self.cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+        self.assertEqual([(date(2021, 1, 1), date(2021, 1, 3))], ranges)
+
+    def test_store_and_load(self):
+        response = JmaIrradiationResponse(CSV_DATA)
+        self.cache.store('daily', STATIONS, response, lta=True)
+        ranges = self.cache.missing_ranges('daily', date(2020, 12, 30), date(2021, 1, 5), STATIONS, lta=True)
+        self.assertEqual([(date(2020, 12, 30), date(2020, 12, 31)), (date(2021, 1, 4), date(2021, 1, 5))], ranges)
+
+        loaded = self.cache.load(JmaIrradiationResponse, 'daily', date(2021, 1, 2), date(2021, 1, 3),
+                                 STATIONS, lta=True)
+        self.assertListEqual(['Date', 'Fukuoka', 'Fukuoka_LT', 'Saga', 'Saga_LT'], loaded.headers)
+        self.assertEqual(2, len(loaded.csv))
+        self.assertEqual('2021-01-02', loaded.csv[0]['Date'])
+        self.assertAlmostEqual(1.07, loaded.csv[0]['Fukuoka'])
+        self.assertIsNone(loaded.csv[0]['Saga'])
+        self.assertAlmostEqual(6.7, loaded.csv[1]['Saga_LT'])
+
+    def test_load_subset_and_kwh(self):
+        self.cache.store('daily', STATIONS, JmaIrradiationResponse(CSV_DATA), lta=True)
+        self.assertEqual([], self.cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 3),
+                                                       [JmaStation.Saga]))
+        loaded = self.cache.load(JmaIrradiationResponse, 'daily', date(2021, 1, 1), date(2021, 1, 1),
+                                 [JmaStation.Saga], kwh=True)
+        self.assertListEqual(['Date', 'Saga'], loaded.headers)
+        self.assertAlmostEqual(6.95 / 3.6, loaded.csv[0]['Saga'])
+
+    def test_volatile_days_are_missing(self):
+        self.cache.today = lambda: date(2021, 1, 3)
+        self.cache.store('daily', STATIONS, JmaIrradiationResponse(CSV_DATA), lta=True)
+        ranges = self.cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+        self.assertEqual([(date(2021, 1, 1), date(2021, 1, 3))], ranges)
+        self.cache.volatile_days = 1
+        ranges = self.cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+        self.assertEqual([(date(2021, 1, 3), date(2021, 1, 3))], ranges)
+
+    def test_ttl(self):
+        self.cache.store('daily', STATIONS, JmaIrradiationResponse(CSV_DATA), lta=True)
+        self.cache.ttl = -1 # everything is stale
+        ranges = self.cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+        self.assertEqual([(date(2021, 1, 1), date(2021, 1, 3))], ranges)
+
+    def test_rejects_kwh_response(self):
+        with self.assertRaises(ValueError):
+            self.cache.store('daily', STATIONS, JmaIrradiationResponse(CSV_DATA, kwh=True), lta=True)
+
+
+MULTI_ELEMENT_CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,福岡
+,合計全天日射量(MJ/㎡),日照時間(時間)
+2021年1月1日,3.6,2.5
+2021年1月2日,1.8,0.4
+'''
+
+
+class TestJmaCacheElements(unittest.TestCase):
+    def test_elements_are_cached_separately(self):
+        cache = JmaCache(today=lambda: date(2021, 3, 1))
+        elements = [JmaElement.GlobalIrradiation, JmaElement.SunshineDuration]
+        stations = [JmaStation.Fukuoka]
+        cache.store('daily', stations, JmaIrradiationResponse(MULTI_ELEMENT_CSV_DATA), elements=elements)
+        self.assertEqual([], cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 2), stations,
+                                                  elements=[JmaElement.SunshineDuration]))
+        self.assertEqual([(date(2021, 1, 1), date(2021, 1, 2))],
+                         cache.missing_ranges('daily', date(2021, 1, 1), date(2021, 1, 2), stations,
+                                              elements=[JmaElement.AirTemperature]))
+        loaded = cache.load(JmaIrradiationResponse, 'daily', date(2021, 1, 1), date(2021, 1, 2), stations,
+                            kwh=True, elements=elements)
+        self.assertListEqual(['Date', 'Fukuoka_GlobalIrradiation', 'Fukuoka_SunshineDuration'], loaded.headers)
+        self.assertAlmostEqual(1.0, loaded.csv[0]['Fukuoka_GlobalIrradiation'])
+        self.assertAlmostEqual(2.5, loaded.csv[0]['Fukuoka_SunshineDuration'])
+
+
+class TestJmaClientWithCache(unittest.TestCase):
+    def test_second_request_served_from_cache(self):
+        cache = JmaCache(today=lambda: date(2021, 3, 1))
+        with MockPortal(CSV_DATA) as portal:
+            with JmaClient(kwh=True, base_url=portal.base_url, cache=cache) as c:
+                first = c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+                second = c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+            self.assertEqual(1, len(portal.forms))
+        self.assertListEqual(first.headers, second.headers)
+        self.assertEqual(first.csv, second.csv)
+        self.assertAlmostEqual(2.53 / 3.6, second.csv[0]['Fukuoka'])
+
+    def test_columnar(self):
+        cache = JmaCache(today=lambda: date(2021, 3, 1))
+        with MockPortal(CSV_DATA) as portal:
+            with JmaClient(kwh=True, base_url=portal.base_url, cache=cache, columnar=True) as c:
+                first = c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 3), STATIONS, lta=True)
+                second = c.get_daily_irradiation(date(2021, 1, 2), date(2021, 1, 3), STATIONS, lta=True)
+            self.assertEqual(1, len(portal.forms))
+        for response in (first, second):
+            self.assertTrue(response.columnar)
+            self.assertEqual(['Fukuoka', 'Fukuoka_LT', 'Saga', 'Saga_LT'], sorted(response.columns))
+        self.assertEqual(3, len(first.timestamps))
+        self.assertAlmostEqual(2.53 / 3.6, first.columns['Fukuoka'][0])
+        self.assertEqual(first.csv[1:], second.csv)
+
+    def test_only_gaps_are_requested(self):
+        cache = JmaCache(today=lambda: date(2021, 3, 1))
+        cache.store('daily', STATIONS, JmaIrradiationResponse(CSV_DATA), lta=True)
+        with MockPortal(CSV_DATA.replace('2021年1月', '2021年2月')) as portal:
+            with JmaClient(base_url=portal.base_url, cache=cache) as c:
+                response = c.get_daily_irradiation(date(2021, 1, 1), date(2021, 2, 3), STATIONS, lta=True)
+            self.assertEqual(1, len(portal.forms))
+            self.assertEqual(['["2021","2021","1","2","4","3"]'], portal.forms[0]['ymdList'])
+        self.assertEqual(6, len(response.csv))
+        self.assertEqual('2021-02-03', response.csv[-1]['Date'])
+        self.assertIsInstance(response, JmaIrradiationResponse)
+        self.assertNotIsInstance(response, JmaHourlyIrradiationResponse)
@@ -0,0 +1,370 @@
+"""Test cases for the client"""
+from datetime import date, timedelta
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from jma.client import JmaClient, JmaQuery, build_params, plan_requests
+from jma.elements import JmaElement
+from jma.exceptions import BadCsvException, JmaException
+from jma.jmastation import JmaStation
+from jma.response import JmaIrradiationResponse
+from jma.session import FileSessionStore, MemorySessionStore
+from jma.tests.portal import MockPortal
+
+
+class TestJmaClientGetMany(unittest.TestCase):
+    def setUp(self):
+        self.client = JmaClient()
+        self.client.sess = requests.Session()
+        self.client.php_sessid = 'abc'
+
+    def test_results_in_input_order(self):
+        def fake_daily(s, e, stations, lta=False):
+            return ('daily', s, lta)
+
+        def fake_hourly(s, e, stations, lta=False):
+            return ('hourly', s, lta)
+
+        queries = [
+            ('daily', date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka]),
+            JmaQuery('hourly', date(2021, 1, 3), date(2021, 1, 3), [JmaStation.Saga], True),
+            ('daily', date(2021, 1, 4), date(2021, 1, 5), [JmaStation.Oita], True),
+        ]
+        with mock.patch.object(self.client, 'get_daily_irradiation', side_effect=fake_daily), \
+             mock.patch.object(self.client, 'get_hourly_irradiation', side_effect=fake_hourly):
+            results = self.client.get_many(queries, max_workers=3)
+
+        self.assertEqual(3, len(results))
+        self.assertEqual(('daily', date(2021, 1, 1), False), results[0].response)
+        self.assertEqual(('hourly', date(2021, 1, 3), True), results[1].response)
+        self.assertEqual(('daily', date(2021, 1, 4), True), results[2].response)
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual('hourly', results[1].query.resolution)
+
+    def test_errors_are_captured(self):
+        def fake_daily(s, e, stations, lta=False):
+            if s.day == 2:
+                raise JmaException('Request failed')
+            return s
+
+        queries = [('daily', date(2021, 1, d), date(2021, 1, d), [JmaStation.Fukuoka]) for d in (1, 2, 3)]
+        with mock.patch.object(self.client, 'get_daily_irradiation', side_effect=fake_daily):
+            results = self.client.get_many(queries)
+
+        self.assertEqual(date(2021, 1, 1), results[0].response)
+        self.assertIsNone(results[1].response)
+        self.assertIsInstance(results[1].error, JmaException)
+        self.assertEqual(date(2021, 1, 3), results[2].response)
+
+    def test_requests_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def fake_daily(s, e, stations, lta=False):
+            barrier.wait() # only passes if all three queries are in flight together
+            return s
+
+        queries = [('daily', date(2021, 1, d), date(2021, 1, d), [JmaStation.Fukuoka]) for d in (1, 2, 3)]
+        with mock.patch.object(self.client, 'get_daily_irradiation', side_effect=fake_daily):
+            results = list(self.client.iter_many(queries, max_workers=3))
+
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(r.error is None for r in results))
+
+    def test_stopping_early_cancels_queued_queries(self):
+        calls = []
+
+        def fake_daily(s, e, stations, lta=False):
+            calls.append(s)
+            time.sleep(0.01)
+            return s
+
+        queries = [('daily', date(2021, 1, d), date(2021, 1, d), [JmaStation.Fukuoka]) for d in range(1, 21)]
+        with mock.patch.object(self.client, 'get_daily_irradiation', side_effect=fake_daily):
+            for result in self.client.iter_many(queries, max_workers=2):
+                break
+        self.assertLessEqual(len(calls), 4) # the queries in flight when the consumer stopped
+
+    def test_unknown_resolution(self):
+        with self.assertRaises(ValueError):
+            self.client.get_many([('weekly', date(2021, 1, 1), date(2021, 1, 1), [])])
+
+
+class TestPlanRequests(unittest.TestCase):
+    def test_single_request_when_it_fits(self):
+        stations = [JmaStation.Fukuoka, JmaStation.Saga]
+        queries = plan_requests(date(2021, 1, 1), date(2021, 1, 31), stations, 'daily')
+        self.assertEqual([JmaQuery('daily', date(2021, 1, 1), date(2021, 1, 31), stations, False)], queries)
+
+    def test_long_hourly_range_is_split(self):
+        stations = [JmaStation.Fukuoka]
+        queries = plan_requests(date(2020, 1, 1), date(2020, 12, 31), stations, 'hourly', max_cells=24*100)
+        self.assertEqual(4, len(queries)) # 366 days in windows of at most 100 days
+        self.assertEqual(date(2020, 1, 1), queries[0].start_date)
+        self.assertEqual(date(2020, 12, 31), queries[-1].end_date)
+        for a, b in zip(queries, queries[1:]):
+            self.assertEqual(1, (b.start_date - a.end_date).days)
+        for q in queries:
+            self.assertLessEqual(((q.end_date - q.start_date).days + 1) * 24, 24*100)
+
+    def test_fewest_requests(self):
+        stations = list(JmaStation)[:10]
+        # 10 stations x 30 days = 300 cells; at most 100 cells per request -> 3 requests minimum
+        queries = plan_requests(date(2021, 1, 1), date(2021, 1, 30), stations, 'daily', max_cells=100)
+        self.assertEqual(3, len(queries))
+        covered = set()
+        for q in queries:
+            cells = len(q.stations) * ((q.end_date - q.start_date).days + 1)
+            self.assertLessEqual(cells, 100)
+            for stn in q.stations:
+                for d in range((q.end_date - q.start_date).days + 1):
+                    covered.add((stn, d + q.start_date.toordinal()))
+        self.assertEqual(300, len(covered))
+
+    def test_lta_doubles_cells(self):
+        stations = [JmaStation.Fukuoka]
+        queries = plan_requests(date(2021, 1, 1), date(2021, 1, 10), stations, 'daily', lta=True, max_cells=10)
+        self.assertEqual(2, len(queries))
+
+    def test_elements_multiply_cells(self):
+        elements = [JmaElement.GlobalIrradiation, JmaElement.SunshineDuration]
+        queries = plan_requests(date(2021, 1, 1), date(2021, 1, 10), [JmaStation.Fukuoka], 'daily',
+                                max_cells=10, elements=elements)
+        self.assertEqual(2, len(queries))
+        self.assertEqual(elements, queries[0].elements)
+
+    def test_station_day_too_large(self):
+        with self.assertRaises(ValueError):
+            plan_requests(date(2021, 1, 1), date(2021, 1, 1), [JmaStation.Fukuoka], 'hourly', max_cells=10)
+
+
+class TestGetIrradiation(unittest.TestCase):
+    def test_merges_planned_requests(self):
+        client = JmaClient()
+        client.sess = requests.Session()
+
+        def fake_daily(s, e, stations, lta=False):
+            headers = ['Date'] + [stn.name for stn in stations]
+            rows = []
+            d = s
+            while d <= e:
+                row = {'Date': d.isoformat()}
+                row.update({stn.name: float(d.day) for stn in stations})
+                rows.append(row)
+                d += timedelta(days=1)
+            return JmaIrradiationResponse.from_rows(headers, rows)
+
+        stations = [JmaStation.Fukuoka, JmaStation.Saga, JmaStation.Oita]
+        with mock.patch.object(client, 'get_daily_irradiation', side_effect=fake_daily) as m:
+            response = client.get_irradiation(date(2021, 1, 1), date(2021, 1, 20), stations, max_cells=20)
+        self.assertEqual(3, m.call_count)
+        self.assertCountEqual(['Date', 'Fukuoka', 'Saga', 'Oita'], response.headers)
+        self.assertEqual(20, len(response.csv))
+        self.assertEqual('2021-01-01', response.csv[0]['Date'])
+        self.assertEqual('2021-01-20', response.csv[-1]['Date'])
+        for row in response.csv:
+            day = float(row['Date'][-2:])
+            self.assertEqual(day, row['Fukuoka'])
+            self.assertEqual(day, row['Oita'])
+
+
+class TestObservations(unittest.TestCase):
+    def test_element_num_list(self):
+        params = build_params('daily', date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka], False, 'sid')
+        self.assertEqual('[["610",""]]', params['elementNumList'])
+        params = build_params('daily', date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka], False, 'sid',
+                              [JmaElement.GlobalIrradiation, JmaElement.AirTemperature])
+        self.assertEqual('[["610",""],["201",""]]', params['elementNumList'])
+
+    def test_get_daily_observations(self):
+        csv_data = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,福岡
+,合計全天日射量(MJ/㎡),平均気温(℃)
+2021年1月1日,3.6,4.5
+'''
+        elements = [JmaElement.GlobalIrradiation, JmaElement.AirTemperature]
+        with MockPortal(csv_data) as portal:
+            with JmaClient(kwh=True, base_url=portal.base_url) as c:
+                response = c.get_daily_observations(date(2021, 1, 1), date(2021, 1, 1), [JmaStation.Fukuoka],
+                                                    elements)
+            self.assertEqual(1, len(portal.forms))
+            self.assertEqual(['[["610",""],["201",""]]'], portal.forms[0]['elementNumList'])
+        series = response.series()
+        self.assertAlmostEqual(1.0, series[('Fukuoka', JmaElement.GlobalIrradiation)][0])
+        self.assertAlmostEqual(4.5, series[('Fukuoka', JmaElement.AirTemperature)][0])
+
+
+class TestTail(unittest.TestCase):
+    @staticmethod
+    def hourly_csv(values):
+        lines = [f'2021年3月22日{h}時,{values.get(h, "--")}' for h in range(1, 25)]
+        return 'ダウンロードした時刻：2021/03/22 12:00:00\n\n,青森\n,日射量(MJ/㎡)\n' + '\n'.join(lines) + '\n'
+
+    def test_only_changes_are_yielded(self):
+        polls = [
+            {6: '0.00', 7: '0.08', 8: '0.42'},
+            {6: '0.00', 7: '0.09', 8: '0.42', 9: '0.70'}, # 7時 revised, 9時 new
+            {6: '0.00', 7: '0.09', 8: '0.42', 9: '0.70'}, # nothing new
+            {6: '0.00', 7: '0.09', 8: '0.42', 9: '0.70', 10: '0.59'},
+        ]
+        with MockPortal(self.hourly_csv(polls[0])) as portal:
+            def sleep(seconds):
+                self.assertEqual(300, seconds)
+                polls.pop(0)
+                portal.csv_data = self.hourly_csv(polls[0])
+
+            with JmaClient(base_url=portal.base_url) as c:
+                tail = c.tail([JmaStation.Aomori], interval=300, today=lambda: date(2021, 3, 22), sleep=sleep)
+                updates = [next(tail) for _ in range(3)]
+            self.assertEqual(4, len(portal.forms))
+            self.assertEqual(['["2021","2021","3","3","21","22"]'], portal.forms[0]['ymdList'])
+            self.assertEqual(['["2021","2021","3","3","22","22"]'], portal.forms[1]['ymdList'])
+
+        self.assertEqual(['2021-03-22 05:00', '2021-03-22 06:00', '2021-03-22 07:00'],
+                         [row['Date'] for row in updates[0].csv])
+        self.assertEqual(['2021-03-22 06:00', '2021-03-22 08:00'], [row['Date'] for row in updates[1].csv])
+        self.assertAlmostEqual(0.09, updates[1].csv[0]['Aomori'])
+        self.assertEqual(['2021-03-22 09:00'], [row['Date'] for row in updates[2].csv])
+
+    def test_failed_polls_are_retried(self):
+        with MockPortal(self.hourly_csv({1: '0.1'})) as portal:
+            portal.error_status = 500
+            portal.error_count = 1
+            with JmaClient(base_url=portal.base_url) as c:
+                tail = c.tail([JmaStation.Aomori], today=lambda: date(2021, 3, 22), sleep=lambda s: None)
+                update = next(tail)
+            self.assertEqual(2, len(portal.forms))
+        self.assertEqual(1, update.row_count)
+
+
+class TestStreaming(unittest.TestCase):
+    def test_stream_from_portal(self):
+        csv_data = '''ダウンロードした時刻：2021/03/24 21:40:23
+
+,青森
+,日射量(MJ/㎡)
+2021年3月22日1時,--
+2021年3月22日2時,0.08
+'''.replace('\n', '\r\n')
+        with MockPortal(csv_data) as portal:
+            with JmaClient(base_url=portal.base_url) as c:
+                response = c.get_hourly_irradiation(date(2021, 3, 22), date(2021, 3, 22),
+                                                    [JmaStation.Aomori], stream=True)
+                self.assertListEqual(['Date', 'Aomori'], response.headers)
+                rows = list(response.iter_rows())
+        self.assertEqual(['2021-03-22 00:00', '2021-03-22 01:00'], [r['Date'] for r in rows])
+        self.assertAlmostEqual(0.08, rows[1]['Aomori'])
+
+
+class TestSessionLifecycle(unittest.TestCase):
+    csv_data = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡
+,合計全天日射量(MJ/㎡)
+2021年1月1日,2.53
+'''
+    args = (date(2021, 1, 1), date(2021, 1, 1), [JmaStation.Fukuoka])
+
+    def test_bootstrap_is_lazy(self):
+        with MockPortal(self.csv_data) as portal:
+            with JmaClient(base_url=portal.base_url) as c:
+                self.assertEqual(0, portal.index_hits)
+                c.get_daily_irradiation(*self.args)
+                c.get_daily_irradiation(*self.args)
+                self.assertEqual('mock-sessid', c.php_sessid)
+            self.assertEqual(1, portal.index_hits)
+            self.assertEqual(['mock-sessid'], portal.forms[0]['PHPSESSID'])
+
+    def test_session_id_shared_through_store(self):
+        store = MemorySessionStore()
+        with MockPortal(self.csv_data) as portal:
+            for _ in range(3):
+                with JmaClient(base_url=portal.base_url, session_store=store) as c:
+                    c.get_daily_irradiation(*self.args)
+            self.assertEqual(1, portal.index_hits)
+
+    def test_expired_session_is_refreshed(self):
+        store = MemorySessionStore()
+        store.set('expired-sessid')
+        with MockPortal(self.csv_data) as portal:
+            portal.check_sid = True
+            with JmaClient(base_url=portal.base_url, session_store=store) as c:
+                response = c.get_daily_irradiation(*self.args)
+            self.assertEqual(1, portal.index_hits)
+            self.assertEqual(['expired-sessid'], portal.forms[0]['PHPSESSID'])
+            self.assertEqual(['mock-sessid'], portal.forms[1]['PHPSESSID'])
+        self.assertAlmostEqual(2.53, response.csv[0]['Fukuoka'])
+        self.assertEqual('mock-sessid', store.get())
+
+    def test_refresh_only_retries_once(self):
+        with MockPortal('<html><head></head><body>error</body></html>') as portal:
+            with JmaClient(base_url=portal.base_url) as c:
+                with self.assertRaises(BadCsvException):
+                    c.get_daily_irradiation(*self.args)
+            self.assertEqual(2, len(portal.forms))
+
+    def test_bad_csv_is_not_retried(self):
+        for stream in (False, True):
+            with MockPortal('garbage,not csv\n') as portal:
+                with JmaClient(base_url=portal.base_url) as c:
+                    with self.assertRaises(BadCsvException):
+                        c.get_daily_irradiation(*self.args, stream=stream)
+                self.assertEqual(1, portal.index_hits)
+                self.assertEqual(1, len(portal.forms))
+
+    def test_html_page_while_streaming_refreshes_session(self):
+        store = MemorySessionStore()
+        store.set('expired-sessid')
+        with MockPortal(self.csv_data) as portal:
+            portal.check_sid = True
+            with JmaClient(base_url=portal.base_url, session_store=store) as c:
+                response = c.get_daily_irradiation(*self.args, stream=True)
+                rows = list(response.iter_rows())
+            self.assertEqual(2, len(portal.forms))
+        self.assertAlmostEqual(2.53, rows[0]['Fukuoka'])
+
+
+class TestSessionStores(unittest.TestCase):
+    def test_memory_store_expiry(self):
+        store = MemorySessionStore(max_age=-1)
+        store.set('abc')
+        self.assertIsNone(store.get())
+        store.max_age = 60
+        store.set('abc')
+        self.assertEqual('abc', store.get())
+        store.clear()
+        self.assertIsNone(store.get())
+
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sid.json')
+            self.assertIsNone(FileSessionStore(path).get())
+            FileSessionStore(path).set('abc')
+            self.assertEqual('abc', FileSessionStore(path).get())
+            FileSessionStore(path, max_age=-1).set('def')
+            self.assertIsNone(FileSessionStore(path).get())
+            FileSessionStore(path).clear()
+            self.assertFalse(os.path.exists(path))
+            with open(path, 'w') as f:
+                f.write('not json')
+            self.assertIsNone(FileSessionStore(path).get())
+
+
+class TestImport(unittest.TestCase):
+    def loaded_after(self, code):
+        code += '; import sys; print(" ".join(m for m in ("requests", "urllib3") if m in sys.modules))'
+        return subprocess.check_output([sys.executable, '-c', code], universal_newlines=True).split()
+
+    def test_import_does_not_load_requests(self):
+        self.assertEqual([], self.loaded_after('import jma, jma.response, jma.archive'))
+
+    def test_client_loads_requests(self):
+        self.assertIn('requests', self.loaded_after('import jma; jma.JmaClient().__enter__()'))
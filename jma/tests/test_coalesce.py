@@ -0,0 +1,94 @@
+"""Test cases for request coalescing"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import threading
+import time
+import unittest
+
+from jma.client import JmaClient
+from jma.coalesce import RequestCoalescer
+from jma.exceptions import JmaException
+from jma.jmastation import JmaStation
+from jma.tests.portal import MockPortal
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡
+,合計全天日射量(MJ/㎡)
+2021年1月1日,2.53
+2021年1月2日,1.07
+2021年1月3日,11.01
+'''
+
+
+class TestRequestCoalescer(unittest.TestCase):
+    def run_pair(self, fetch, second_key, second_range):
+        """Start a call to fetch, and a second call once the first one is in flight"""
+        coalescer = RequestCoalescer()
+        started = threading.Event()
+        release = threading.Event()
+
+        def leader():
+            started.set()
+            release.wait(5)
+            return fetch()
+
+        calls = []
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(coalescer.run, 'k', date(2021, 1, 1), date(2021, 1, 3), leader)
+            started.wait(5)
+            second = pool.submit(coalescer.run, second_key, *second_range, lambda: calls.append(1) or 'own')
+            time.sleep(0.05) # let the second call reach the coalescer
+            release.set()
+        return first, second, calls, coalescer
+
+    def test_covered_range_waits_for_result(self):
+        first, second, calls, coalescer = self.run_pair(lambda: 'shared', 'k', (date(2021, 1, 2), date(2021, 1, 3)))
+        self.assertEqual(('shared', False), first.result())
+        self.assertEqual(('shared', True), second.result())
+        self.assertEqual([], calls)
+        self.assertEqual(1, coalescer.shared)
+
+    def test_other_key_or_range_is_fetched(self):
+        _, second, calls, _ = self.run_pair(lambda: 'a', 'other', (date(2021, 1, 2), date(2021, 1, 3)))
+        self.assertEqual(('own', False), second.result())
+        _, second, calls, _ = self.run_pair(lambda: 'a', 'k', (date(2021, 1, 2), date(2021, 1, 4)))
+        self.assertEqual(('own', False), second.result())
+
+    def test_error_is_shared(self):
+        def fail():
+            raise JmaException('Request failed')
+        first, second, _, _ = self.run_pair(fail, 'k', (date(2021, 1, 1), date(2021, 1, 1)))
+        self.assertRaises(JmaException, first.result)
+        self.assertRaises(JmaException, second.result)
+
+
+class TestClientCoalescing(unittest.TestCase):
+    def test_one_post_for_overlapping_queries(self):
+        stations = [JmaStation.Fukuoka]
+        with MockPortal(CSV_DATA) as portal:
+            portal.latency = 0.3
+            with JmaClient(base_url=portal.base_url) as c:
+                c.php_sessid = 'mock-sessid'
+                with ThreadPoolExecutor(max_workers=3) as pool:
+                    full = pool.submit(c.get_daily_irradiation, date(2021, 1, 1), date(2021, 1, 3), stations)
+                    while portal.in_flight == 0:
+                        time.sleep(0.01)
+                    part = pool.submit(c.get_daily_irradiation, date(2021, 1, 2), date(2021, 1, 3), stations)
+                    same = pool.submit(c.get_daily_irradiation, date(2021, 1, 1), date(2021, 1, 3), stations)
+                    full, part, same = full.result(), part.result(), same.result()
+            self.assertEqual(1, len(portal.forms))
+        self.assertEqual(3, len(full.csv))
+        self.assertEqual(full.csv, same.csv)
+        self.assertEqual(['2021-01-02', '2021-01-03'], [row['Date'] for row in part.csv])
+        self.assertEqual(['Date', 'Fukuoka'], part.headers)
+
+    def test_disabled(self):
+        with MockPortal(CSV_DATA) as portal:
+            portal.latency = 0.2
+            with JmaClient(base_url=portal.base_url, coalesce=False) as c:
+                c.php_sessid = 'mock-sessid'
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    for _ in range(2):
+                        pool.submit(c.get_daily_irradiation, date(2021, 1, 1), date(2021, 1, 3), [JmaStation.Fukuoka])
+            self.assertEqual(2, len(portal.forms))
@@ -0,0 +1,96 @@
+"""Test cases for request instrumentation"""
+from datetime import date
+import unittest
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+from jma.client import JmaClient
+from jma.exceptions import JmaException
+from jma.jmastation import JmaStation
+from jma.metrics import RequestMetrics, PrometheusObserver
+from jma.tests.portal import MockPortal
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡
+,合計全天日射量(MJ/㎡)
+2021年1月1日,2.53
+2021年1月2日,1.07
+'''
+
+ARGS = (date(2021, 1, 1), date(2021, 1, 2), [JmaStation.Fukuoka])
+
+
+class TestObserver(unittest.TestCase):
+    def test_metrics_reported(self):
+        reports = []
+        with MockPortal(CSV_DATA) as portal:
+            with JmaClient(base_url=portal.base_url, observer=reports.append) as c:
+                c.get_daily_irradiation(*ARGS)
+                c.get_daily_irradiation(*ARGS)
+        self.assertEqual(2, len(reports))
+        first, second = reports
+        self.assertEqual('daily', first.resolution)
+        self.assertGreater(first.bootstrap_time, 0)
+        self.assertIsNone(second.bootstrap_time)
+        self.assertEqual(200, first.status)
+        self.assertEqual(len(CSV_DATA.encode('cp932')), first.response_bytes)
+        self.assertEqual(2, first.rows)
+        self.assertEqual(0, first.retries)
+        self.assertIsNone(first.error)
+        for m in reports:
+            for field in ('post_time', 'decode_time', 'parse_time', 'total_time'):
+                self.assertGreaterEqual(getattr(m, field), 0)
+
+    def test_retry_counted(self):
+        reports = []
+        with MockPortal(CSV_DATA) as portal:
+            portal.check_sid = True
+            with JmaClient(base_url=portal.base_url, observer=reports.append) as c:
+                c.php_sessid = 'expired'
+                c.get_daily_irradiation(*ARGS)
+        self.assertEqual(1, reports[0].retries)
+        self.assertIsNotNone(reports[0].bootstrap_time)
+
+    def test_error_reported(self):
+        reports = []
+        with MockPortal(CSV_DATA) as portal:
+            portal.error_status = 503
+            with JmaClient(base_url=portal.base_url, observer=reports.append) as c:
+                with self.assertRaises(JmaException):
+                    c.get_daily_irradiation(*ARGS)
+        self.assertEqual(503, reports[0].status)
+        self.assertIsInstance(reports[0].error, JmaException)
+
+    def test_failing_observer_is_ignored(self):
+        def observer(metrics):
+            raise RuntimeError('broken sink')
+        with MockPortal(CSV_DATA) as portal:
+            with JmaClient(base_url=portal.base_url, observer=observer) as c:
+                response = c.get_daily_irradiation(*ARGS)
+        self.assertEqual(2, len(response.csv))
+
+
+@unittest.skipIf(prometheus_client is None, 'prometheus_client is not installed')
+class TestPrometheusObserver(unittest.TestCase):
+    def test_export(self):
+        registry = prometheus_client.CollectorRegistry()
+        observer = PrometheusObserver(registry=registry)
+        metrics = RequestMetrics('hourly')
+        metrics.post_time = 0.5
+        metrics.parse_time = 0.1
+        metrics.response_bytes = 1000
+        metrics.rows = 24
+        metrics.retries = 1
+        observer(metrics)
+        observer(metrics)
+        get = registry.get_sample_value
+        self.assertEqual(2, get('jma_requests_total', {'resolution': 'hourly', 'outcome': 'ok'}))
+        self.assertEqual(2000, get('jma_response_bytes_total', {'resolution': 'hourly'}))
+        self.assertEqual(48, get('jma_rows_total', {'resolution': 'hourly'}))
+        self.assertEqual(2, get('jma_retries_total', {'resolution': 'hourly'}))
+        self.assertEqual(1.0, get('jma_request_phase_seconds_sum', {'resolution': 'hourly', 'phase': 'post'}))
+        self.assertIsNone(get('jma_request_phase_seconds_count', {'resolution': 'hourly', 'phase': 'bootstrap'}))
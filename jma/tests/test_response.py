@@ -1,6 +1,11 @@
 """Test cases for responses"""
+from datetime import date, datetime, timedelta, timezone
+import math
 import unittest
-from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.elements import JmaElement
+from jma.exceptions import BadCsvException
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse, merge_responses, iter_lines
+from jma.rows import JmaRow
 
 class TestJmaIrradiationResponse(unittest.TestCase):
     def setUp(self):
@@ -104,6 +109,21 @@ class TestJmaIrradiationResponse(unittest.TestCase):
         for i, date in enumerate(dates):
             self.assertEqual(f'2021-01-{i+1:02}', date)
 
+    def test_parse_dates_out_of_sequence(self):
+        csv_data = self.csv_data.replace('2021年1月2日', '2020年12月31日').replace('2021年1月6日', '2021年2月1日')
+        response = JmaIrradiationResponse(csv_data)
+        dates = [row['Date'] for row in response.csv]
+        expected = ['2021-01-01', '2020-12-31', '2021-01-03', '2021-01-04', '2021-01-05', '2021-02-01']
+        self.assertListEqual(expected, dates)
+
+    def test_parse_dates_month_boundary(self):
+        csv_data = self.csv_data.replace('2021年1月1日', '2020年12月31日')
+        for i in range(2, 7):
+            csv_data = csv_data.replace(f'2021年1月{i}日', f'2021年1月{i-1}日')
+        response = JmaIrradiationResponse(csv_data, date_type='datetime')
+        self.assertEqual(datetime(2020, 12, 31), response.csv[0]['Date'])
+        self.assertEqual(datetime(2021, 1, 5), response.csv[5]['Date'])
+
     def test_parse_data_incomplete_kwh(self):
         response = JmaIrradiationResponse(self.csv_data_incomplete, kwh=True)
         row0 = response.csv[0]
@@ -112,10 +132,256 @@ class TestJmaIrradiationResponse(unittest.TestCase):
         self.assertAlmostEqual(row1['Matsue'], 0.994444, 3)
         self.assertIsNone(row0['Matsue_LT'])
         self.assertIsNone(row1['Matsue_LT'])
-        self.assertIsNone(row0['山口'])
-        self.assertIsNone(row1['山口'])
-        self.assertIsNone(row0['山口_LT'])
-        self.assertIsNone(row1['山口_LT'])
+        self.assertIsNone(row0['Yamaguchi'])
+        self.assertIsNone(row1['Yamaguchi'])
+        self.assertIsNone(row0['Yamaguchi_LT'])
+        self.assertIsNone(row1['Yamaguchi_LT'])
+
+    def test_merge_stations(self):
+        a = JmaIrradiationResponse(self.csv_data)
+        b = JmaIrradiationResponse(self.csv_data_with_lta)
+        merged = merge_responses([a, b])
+        expected = ['Date', 'Fukuoka', 'Saga', 'Nagasaki', 'Morioka', 'Morioka_LT', 'Akita', 'Akita_LT']
+        self.assertListEqual(expected, merged.headers)
+        self.assertEqual(6, len(merged.csv))
+        self.assertAlmostEqual(2.53, merged.csv[0]['Fukuoka'])
+        self.assertAlmostEqual(4.01, merged.csv[0]['Morioka'])
+        self.assertIsNone(merged.csv[2]['Morioka'])
+
+    def test_merge_dates(self):
+        csv_later = self.csv_data.replace('2021年1月', '2021年2月')
+        merged = merge_responses([JmaIrradiationResponse(csv_later), JmaIrradiationResponse(self.csv_data)])
+        self.assertEqual(12, len(merged.csv))
+        self.assertEqual('2021-01-01', merged.csv[0]['Date'])
+        self.assertEqual('2021-02-06', merged.csv[-1]['Date'])
+        self.assertIsInstance(merged, JmaIrradiationResponse)
+
+    def test_slice(self):
+        for columnar in (False, True):
+            response = JmaIrradiationResponse(self.csv_data, columnar=columnar)
+            part = response.slice(date(2021, 1, 2), date(2021, 1, 3))
+            self.assertEqual(columnar, part.columnar)
+            self.assertListEqual(['Date', 'Fukuoka', 'Saga', 'Nagasaki'], part.headers)
+            self.assertEqual(['2021-01-02', '2021-01-03'], [row['Date'] for row in part.csv])
+            self.assertAlmostEqual(11.68, part.csv[1]['Saga'])
+            self.assertEqual(6, response.row_count)
+
+
+class TestRows(unittest.TestCase):
+    csv_data = '''ダウンロードした時刻：2021/01/11 00:34:52
+
+,盛岡,盛岡,秋田,秋田
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+,,平年値(MJ/㎡),,平年値(MJ/㎡)
+2021年1月1日,4.01,5.9,2.46,4.0
+2021年1月2日,8.16,5.9,,4.0
+'''
+
+    def test_mapping_interface(self):
+        row = JmaIrradiationResponse(self.csv_data).csv[1]
+        self.assertIsInstance(row, JmaRow)
+        self.assertAlmostEqual(8.16, row['Morioka'])
+        self.assertIsNone(row['Akita'])
+        self.assertEqual(['Date', 'Morioka', 'Morioka_LT', 'Akita', 'Akita_LT'], list(row))
+        self.assertEqual({'Date': '2021-01-02', 'Morioka': 8.16, 'Morioka_LT': 5.9, 'Akita': None,
+                          'Akita_LT': 4.0}, dict(row))
+        self.assertIn('Akita_LT', row)
+        self.assertIsNone(row.get('Fukuoka'))
+        with self.assertRaises(KeyError):
+            row['Fukuoka']
+        with self.assertRaises(TypeError):
+            row['Morioka'] = 0
+
+    def test_rows_are_compact(self):
+        a = JmaIrradiationResponse(self.csv_data)
+        b = JmaIrradiationResponse(self.csv_data, columnar=True)
+        self.assertFalse(hasattr(a.csv[0], '__dict__'))
+        self.assertIs(type(a.csv[0]), type(b.csv[1])) # one class per header list
+        self.assertIs(a.headers[2], type(a.csv[0]).headers[2]) # interned
+        self.assertEqual(a.csv, b.csv)
+
+    def test_pickle(self):
+        import pickle
+        row = JmaIrradiationResponse(self.csv_data).csv[0]
+        copy = pickle.loads(pickle.dumps(row))
+        self.assertEqual(row, copy)
+        self.assertIs(type(row), type(copy))
+
+
+class TestMultipleElements(unittest.TestCase):
+    csv_data = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,福岡,佐賀,佐賀
+,合計全天日射量(MJ/㎡),日照時間(時間),合計全天日射量(MJ/㎡),日照時間(時間)
+2021年1月1日,3.6,2.5,7.2,6.1
+2021年1月2日,1.8,0.4,,3.0
+'''
+
+    def test_parse_headers(self):
+        response = JmaIrradiationResponse(self.csv_data)
+        self.assertListEqual(['Date', 'Fukuoka_GlobalIrradiation', 'Fukuoka_SunshineDuration',
+                              'Saga_GlobalIrradiation', 'Saga_SunshineDuration'], response.headers)
+        self.assertListEqual([JmaElement.GlobalIrradiation, JmaElement.SunshineDuration] * 2, response.elements)
+
+    def test_kwh_only_converts_irradiation(self):
+        for columnar in (False, True):
+            response = JmaIrradiationResponse(self.csv_data, kwh=True, columnar=columnar)
+            row = response.csv[0]
+            self.assertAlmostEqual(1.0, row['Fukuoka_GlobalIrradiation'])
+            self.assertAlmostEqual(2.5, row['Fukuoka_SunshineDuration'])
+            self.assertAlmostEqual(6.1, row['Saga_SunshineDuration'])
+
+    def test_series(self):
+        series = JmaIrradiationResponse(self.csv_data).series()
+        self.assertEqual([7.2, None], series[('Saga', JmaElement.GlobalIrradiation)])
+        self.assertEqual([2.5, 0.4], series[('Fukuoka', JmaElement.SunshineDuration)])
+        self.assertEqual({}, JmaIrradiationResponse(self.csv_data).series(lta=True))
+
+    def test_merge_keeps_elements(self):
+        merged = merge_responses([JmaIrradiationResponse(self.csv_data)])
+        self.assertListEqual([JmaElement.GlobalIrradiation, JmaElement.SunshineDuration] * 2, merged.elements)
+        self.assertEqual([2.5, 0.4], merged.series()[('Fukuoka', JmaElement.SunshineDuration)])
+
+
+class TestColumnarResponse(unittest.TestCase):
+    def setUp(self):
+        self.csv_data = TestJmaIrradiationResponse.csv_data_incomplete = '''ダウンロードした時刻：2021/01/10 23:54:52
+
+,山口,山口,松江,松江
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+,,平年値(MJ/㎡),,平年値(MJ/㎡)
+2021年1月1日,,,5.85,
+2021年1月2日,,,3.58,
+'''
+
+    def test_rows_with_wrong_length(self):
+        header = '''ダウンロードした時刻：2021/01/10 23:54:52
+
+,福岡,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+'''
+        for rows in ('2021年1月1日,2.53\n2021年1月2日,1.07,3.56\n', '2021年1月1日,2.53,3.1,4.2\n'):
+            for columnar in (False, True):
+                with self.assertRaises(BadCsvException):
+                    JmaIrradiationResponse(header + rows, columnar=columnar)
+
+    def test_columns(self):
+        response = JmaIrradiationResponse(self.csv_data, columnar=True)
+        self.assertListEqual(['Date', 'Yamaguchi', 'Yamaguchi_LT', 'Matsue', 'Matsue_LT'], response.headers)
+        self.assertEqual('d', response.columns['Matsue'].typecode)
+        self.assertAlmostEqual(3.58, response.columns['Matsue'][1])
+        self.assertTrue(math.isnan(response.columns['Matsue_LT'][0]))
+        self.assertEqual(1609459200, response.timestamps[0]) # 2021-01-01T00:00
+
+    def test_csv_view_matches_row_mode(self):
+        rows = JmaIrradiationResponse(self.csv_data, kwh=True).csv
+        view = JmaIrradiationResponse(self.csv_data, kwh=True, columnar=True).csv
+        self.assertEqual(rows, view)
+
+    def test_hourly_csv_view(self):
+        csv_data = '''ダウンロードした時刻：2021/03/24 21:40:23
+
+,青森
+,日射量(MJ/�u)
+2021年3月22日23時,--
+2021年3月22日24時,0.5
+2021年3月23日1時,--
+'''
+        rows = JmaHourlyIrradiationResponse(csv_data).csv
+        view = JmaHourlyIrradiationResponse(csv_data, columnar=True).csv
+        self.assertEqual(rows, view)
+
+    def test_merge_keeps_columnar(self):
+        a = JmaIrradiationResponse(self.csv_data, columnar=True)
+        b = JmaIrradiationResponse(self.csv_data.replace('2021年1月', '2021年2月'), columnar=True)
+        merged = merge_responses([a, b])
+        self.assertTrue(merged.columnar)
+        self.assertEqual(4, len(merged.timestamps))
+        self.assertEqual('2021-02-02', merged.csv[-1]['Date'])
+
+    def test_to_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        response = JmaIrradiationResponse(self.csv_data, columnar=True)
+        arrays = response.to_numpy()
+        self.assertEqual(np.datetime64('2021-01-02T00:00:00'), arrays['Date'][1])
+        self.assertEqual(np.float64, arrays['Matsue'].dtype)
+        self.assertAlmostEqual(5.85, arrays['Matsue'][0])
+        self.assertTrue(np.shares_memory(arrays['Matsue'], np.frombuffer(response.columns['Matsue'])))
+        row_arrays = JmaIrradiationResponse(self.csv_data).to_numpy()
+        np.testing.assert_array_equal(arrays['Date'], row_arrays['Date'])
+        np.testing.assert_array_equal(arrays['Matsue_LT'], row_arrays['Matsue_LT'])
+
+    def test_to_pandas(self):
+        try:
+            import pandas as pd
+        except ImportError:
+            self.skipTest('pandas is not installed')
+        df = JmaIrradiationResponse(self.csv_data, columnar=True).to_pandas()
+        self.assertListEqual(['Yamaguchi', 'Yamaguchi_LT', 'Matsue', 'Matsue_LT'], list(df.columns))
+        self.assertAlmostEqual(3.58, df.loc[pd.Timestamp('2021-01-02'), 'Matsue'])
+
+    def test_to_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        table = JmaIrradiationResponse(self.csv_data, columnar=True).to_arrow()
+        self.assertEqual(['Date', 'Yamaguchi', 'Yamaguchi_LT', 'Matsue', 'Matsue_LT'], table.column_names)
+        self.assertEqual(pa.timestamp('s'), table.schema.field('Date').type)
+        self.assertAlmostEqual(5.85, table.column('Matsue')[0].as_py())
+
+
+class TestStreamingResponse(unittest.TestCase):
+    def setUp(self):
+        self.csv_data = '''ダウンロードした時刻：2021/01/11 00:34:52
+
+,盛岡,盛岡,秋田,秋田
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+,,平年値(MJ/㎡),,平年値(MJ/㎡)
+2021年1月1日,4.01,5.9,2.46,4.0
+2021年1月2日,8.16,5.9,2.44,4.0
+'''.replace('\n', '\r\n')
+        self.body = self.csv_data.encode('cp932')
+
+    def chunks(self, size):
+        return (self.body[i:i+size] for i in range(0, len(self.body), size))
+
+    def test_iter_lines_splits_multibyte_characters(self):
+        lines = list(iter_lines(self.chunks(3), encoding='cp932'))
+        self.assertEqual(self.csv_data.split('\r\n'), lines)
+
+    def test_stream_matches_full_parse(self):
+        expected = JmaIrradiationResponse(self.csv_data, kwh=True)
+        for size in (1, 7, 4096):
+            response = JmaIrradiationResponse.stream(self.chunks(size), kwh=True, encoding='cp932')
+            self.assertListEqual(expected.headers, response.headers)
+            self.assertEqual(expected.csv, list(response.iter_rows()))
+
+    def test_stream_is_lazy(self):
+        consumed = []
+
+        def chunks():
+            for line in self.body.splitlines(keepends=True):
+                consumed.append(line)
+                yield line
+        response = JmaIrradiationResponse.stream(chunks(), encoding='cp932')
+        self.assertEqual(['Date', 'Morioka', 'Morioka_LT', 'Akita', 'Akita_LT'], response.headers)
+        self.assertEqual(6, len(consumed)) # preamble, headers and the first data line
+        rows = response.iter_rows()
+        self.assertEqual('2021-01-01', next(rows)['Date'])
+        self.assertEqual(6, len(consumed))
+
+    def test_stream_html(self):
+        html = '<html><head></head><body>error</body></html>'.encode('cp932')
+        with self.assertRaises(BadCsvException):
+            JmaIrradiationResponse.stream([html])
+
+    def test_iter_rows_on_parsed_response(self):
+        response = JmaIrradiationResponse(self.csv_data)
+        self.assertEqual(response.csv, list(response.iter_rows()))
 
 
 class TestJmaHourlyIrradiationResponse(unittest.TestCase):
@@ -156,6 +422,25 @@ class TestJmaHourlyIrradiationResponse(unittest.TestCase):
             row = response.csv[hour]
             self.assertEqual(f'2021-03-22 {hour:02}:00', row['Date'])
 
+    def test_parse_times_across_days(self):
+        csv_data = self.csv_data.replace('2021年3月22日24時,--\n', '2021年3月22日24時,--\n2021年3月23日1時,0.1\n2021年3月23日3時,0.2\n')
+        response = JmaHourlyIrradiationResponse(csv_data)
+        self.assertEqual('2021-03-22 23:00', response.csv[23]['Date'])
+        self.assertEqual('2021-03-23 00:00', response.csv[24]['Date'])
+        self.assertEqual('2021-03-23 02:00', response.csv[25]['Date']) # gap in the sequence
+
+    def test_date_types(self):
+        dt = JmaHourlyIrradiationResponse(self.csv_data, date_type='datetime')
+        self.assertEqual(datetime(2021, 3, 22, 5), dt.csv[5]['Date'])
+        epoch = JmaHourlyIrradiationResponse(self.csv_data, date_type='epoch')
+        self.assertEqual(int(datetime(2021, 3, 22, 5, tzinfo=timezone(timedelta(hours=9))).timestamp()),
+                         epoch.csv[5]['Date'])
+        columnar = JmaHourlyIrradiationResponse(self.csv_data, date_type='epoch', columnar=True)
+        self.assertEqual(epoch.csv, columnar.csv)
+        self.assertEqual(list(columnar.timestamps), list(epoch._columns_from_rows()[0]))
+        with self.assertRaises(ValueError):
+            JmaHourlyIrradiationResponse(self.csv_data, date_type='julian')
+
     def test_parse_values(self):
         response = JmaHourlyIrradiationResponse(self.csv_data)
         expected = [None, None, None, None, None, 0.00, 0.08, 0.42, 0.70, 0.59, 1.03, 1.56,
@@ -167,3 +452,32 @@ class TestJmaHourlyIrradiationResponse(unittest.TestCase):
                 self.assertIsNone(expected[i])
             else:
                 self.assertAlmostEqual(expected[i], actual)
+
+    def test_to_daily(self):
+        csv_data = self.csv_data + '2021年3月23日1時,--\n2021年3月23日12時,1.5\n'
+        for columnar in (False, True):
+            daily = JmaHourlyIrradiationResponse(csv_data, columnar=columnar).to_daily()
+            self.assertIsInstance(daily, JmaIrradiationResponse)
+            self.assertNotIsInstance(daily, JmaHourlyIrradiationResponse)
+            self.assertListEqual(['Date', 'Aomori'], daily.headers)
+            self.assertEqual(['2021-03-22', '2021-03-23'], [row['Date'] for row in daily.csv])
+            self.assertAlmostEqual(6.59, daily.csv[0]['Aomori']) # 24時 belongs to the 22nd
+            self.assertAlmostEqual(1.5, daily.csv[1]['Aomori'])
+
+    def test_resample(self):
+        response = JmaHourlyIrradiationResponse(self.csv_data)
+        coverage = response.resample('daily', 'coverage')
+        self.assertAlmostEqual(14 / 24, coverage.csv[0]['Aomori'])
+        self.assertIsNone(response.to_daily(min_coverage=0.9).csv[0]['Aomori'])
+        self.assertAlmostEqual(1.56, response.resample('monthly', 'max').csv[0]['Aomori'])
+        self.assertEqual('2021-03-01', response.resample('monthly', 'mean').csv[0]['Date'])
+        windows = response.resample(timedelta(hours=6), 'sum')
+        self.assertIsInstance(windows, JmaHourlyIrradiationResponse)
+        self.assertEqual(['2021-03-22 00:00', '2021-03-22 06:00', '2021-03-22 12:00', '2021-03-22 18:00'],
+                         [row['Date'] for row in windows.csv])
+        self.assertEqual(0.0, windows.csv[0]['Aomori']) # only 6時 has a value
+        self.assertAlmostEqual(0.08 + 0.42 + 0.70 + 0.59 + 1.03 + 1.56, windows.csv[1]['Aomori'])
+        with self.assertRaises(ValueError):
+            response.resample('weekly')
+        with self.assertRaises(ValueError):
+            response.resample('daily', 'median')
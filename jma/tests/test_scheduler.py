@@ -0,0 +1,115 @@
+"""Test cases for the request scheduler"""
+from datetime import date
+import threading
+import time
+import unittest
+
+import requests
+
+from jma.client import JmaClient
+from jma.jmastation import JmaStation
+from jma.scheduler import RequestScheduler
+from jma.tests.portal import MockPortal
+
+
+class FakeResponse():
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.scheduler = RequestScheduler(rate=1000, burst=10, sleep=self.sleeps.append, rng=lambda: 0.5)
+
+    def test_retry_until_success(self):
+        statuses = [503, 502, 200]
+        retries = []
+        res = self.scheduler.run(lambda: FakeResponse(statuses.pop(0)), on_retry=lambda: retries.append(1))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual([0.5, 1.0], self.sleeps) # jittered exponential backoff
+        self.assertEqual(2, len(retries))
+
+    def test_retries_exhausted(self):
+        res = self.scheduler.run(lambda: FakeResponse(500))
+        self.assertEqual(500, res.status_code)
+        self.assertEqual(3, len(self.sleeps))
+
+    def test_client_errors_are_not_retried(self):
+        res = self.scheduler.run(lambda: FakeResponse(404))
+        self.assertEqual(404, res.status_code)
+        self.assertEqual([], self.sleeps)
+
+    def test_timeouts_are_retried(self):
+        def send():
+            raise requests.exceptions.Timeout()
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.scheduler.run(send)
+        self.assertEqual(3, len(self.sleeps))
+
+    def test_backoff_is_capped(self):
+        self.scheduler.backoff_max = 4
+        self.scheduler.rng = lambda: 1
+        self.assertEqual(4, self.scheduler.backoff(10))
+
+    def test_additive_increase_multiplicative_decrease(self):
+        self.scheduler.limit = 2.0
+        for _ in range(4):
+            self.scheduler.run(lambda: FakeResponse(200))
+        self.assertGreater(self.scheduler.limit, 3)
+        limit = self.scheduler.limit
+        self.scheduler.max_retries = 0
+        self.scheduler.run(lambda: FakeResponse(503))
+        self.assertAlmostEqual(limit / 2, self.scheduler.limit)
+        self.scheduler.report_overload()
+        self.assertEqual(1, self.scheduler.limit)
+
+    def test_concurrency_limit(self):
+        scheduler = RequestScheduler(rate=1000, burst=10, initial_concurrency=2, latency_target=0)
+        lock = threading.Lock()
+        state = {'now': 0, 'max': 0}
+
+        def send():
+            with lock:
+                state['now'] += 1
+                state['max'] = max(state['max'], state['now'])
+            time.sleep(0.02)
+            with lock:
+                state['now'] -= 1
+            return FakeResponse(200)
+
+        threads = [threading.Thread(target=scheduler.run, args=(send,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(state['max'], 2) # slow responses never raise the limit
+
+    def test_rate_limit(self):
+        scheduler = RequestScheduler(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(5):
+            scheduler.run(lambda: FakeResponse(200))
+        self.assertGreaterEqual(time.monotonic() - start, 4 / 50 * 0.9)
+
+
+class TestClientWithScheduler(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        csv_data = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡
+,合計全天日射量(MJ/㎡)
+2021年1月1日,2.53
+'''
+        reports = []
+        scheduler = RequestScheduler(sleep=lambda s: None)
+        with MockPortal(csv_data) as portal:
+            portal.error_status = 503
+            portal.error_count = 2
+            with JmaClient(base_url=portal.base_url, scheduler=scheduler, observer=reports.append) as c:
+                response = c.get_daily_irradiation(date(2021, 1, 1), date(2021, 1, 1), [JmaStation.Fukuoka])
+        self.assertAlmostEqual(2.53, response.csv[0]['Fukuoka'])
+        self.assertEqual(2, reports[0].retries)
@@ -0,0 +1,79 @@
+"""Test cases for the station catalog"""
+import math
+import os
+import tempfile
+import unittest
+
+from jma.jmastation import JmaStation
+from jma.response import JmaIrradiationResponse
+from jma.stations import get_catalog, load_catalog, station_name_en, EARTH_RADIUS
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class TestStationCatalog(unittest.TestCase):
+    def test_catalog_matches_enum(self):
+        catalog = get_catalog()
+        self.assertEqual({s.value for s in JmaStation}, {s.id for s in catalog})
+        for station in JmaStation:
+            self.assertEqual(station.name, catalog.get(station.value).name_en)
+        self.assertEqual(len(catalog), len({s.name_jp for s in catalog}))
+        self.assertEqual(len(catalog), len({s.name_en for s in catalog}))
+
+    def test_lookups(self):
+        catalog = get_catalog()
+        self.assertEqual('Hikone', catalog.get_by_name_jp('彦根').name_en)
+        self.assertEqual('s47604', catalog.get_by_name_en('Niigata').id)
+        self.assertEqual('福岡', catalog.get('s47807').name_jp)
+        self.assertIsNone(catalog.get('s00000'))
+        self.assertEqual('Fujisan', station_name_en('富士山'))
+        self.assertEqual('東京', station_name_en('東京'))
+
+    def test_enum(self):
+        self.assertIs(JmaStation.Miyazaki, JmaStation.Miyakazki)
+        self.assertIs(JmaStation.Miyazaki, JmaStation('s47830'))
+        self.assertIs(JmaStation.Ibukiyama, JmaStation.Ibukiksan)
+        self.assertEqual('Ibukiyama', JmaStation('s47751').name)
+        self.assertEqual('Miyazaki', JmaStation.Miyazaki.info.name_en)
+        self.assertTrue(JmaStation.Niigata.info.irradiation)
+        self.assertFalse(JmaStation.Kobe.info.irradiation)
+        self.assertEqual('Hyogo', JmaStation.Kobe.info.prefecture)
+
+    def test_nearest(self):
+        catalog = get_catalog()
+        points = [(35.0, 135.9), (26.3, 127.8), (43.5, 142.0), (33.6, 130.4), (36.0, 140.0), (20.0, 150.0)]
+        for k in (1, 3, 100):
+            for irradiation in (True, False):
+                candidates = [s for s in catalog if s.irradiation or not irradiation]
+                for lat, lon in points:
+                    result = catalog.nearest(lat, lon, k=k, irradiation=irradiation)
+                    expected = sorted(candidates, key=lambda s: haversine(lat, lon, s.latitude, s.longitude))[:k]
+                    self.assertEqual([s.id for s in expected], [s.id for s, _ in result])
+                    for s, km in result:
+                        self.assertAlmostEqual(haversine(lat, lon, s.latitude, s.longitude), km, places=6)
+        self.assertEqual('Hikone', catalog.nearest(35.0, 135.9)[0][0].name_en)
+        self.assertEqual([], catalog.nearest(35.0, 135.9, k=0))
+
+    def test_load_catalog(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stations.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('id,name_jp,name_en,prefecture,latitude,longitude,irradiation\n')
+                f.write('s47662,東京,Tokyo,Tokyo,35.692,139.750,1\n')
+            catalog = load_catalog(path)
+        self.assertEqual(1, len(catalog))
+        self.assertEqual('Tokyo', catalog.nearest(35.0, 139.0)[0][0].name_en)
+
+    def test_response_headers(self):
+        text = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,彦根,新潟,東京
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+2021年1月1日,2.53,6.95,7.1
+'''
+        response = JmaIrradiationResponse(text)
+        self.assertEqual(['Date', 'Hikone', 'Niigata', '東京'], response.headers)
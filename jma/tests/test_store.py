@@ -0,0 +1,93 @@
+"""Test cases for the memory-mapped series store"""
+from datetime import date, datetime, timedelta
+import math
+import os
+import tempfile
+import unittest
+
+from jma.jmastation import JmaStation
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.store import SeriesStore
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,福岡,佐賀,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+,,平年値(MJ/㎡),,平年値(MJ/㎡)
+2021年1月3日,2.53,6.0,6.95,6.5
+2021年1月4日,1.07,6.1,,6.6
+2021年1月5日,11.01,6.2,11.68,6.7
+'''
+
+STATIONS = [JmaStation.Fukuoka, JmaStation.Saga]
+
+
+class TestSeriesStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SeriesStore(self.tmp.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def values(self, *args, **kwargs):
+        return [None if math.isnan(x) else x for x in self.store.read(*args, **kwargs).values]
+
+    def test_append_and_read(self):
+        self.assertEqual(12, self.store.append('daily', STATIONS, JmaIrradiationResponse(CSV_DATA)))
+        window = self.store.read(JmaStation.Fukuoka, 'daily', date(2021, 1, 4), date(2021, 1, 5))
+        self.assertEqual(datetime(2021, 1, 4), window.start)
+        self.assertEqual(timedelta(days=1), window.step)
+        self.assertTrue(window.values.readonly)
+        self.assertEqual([1.07, 11.01], list(window.values))
+        self.assertEqual([6.95, None, 11.68], self.values(JmaStation.Saga, 'daily', date(2021, 1, 1), date(2021, 2, 1)))
+        self.assertEqual([6.6], self.values(JmaStation.Saga, 'daily', date(2021, 1, 4), date(2021, 1, 4), lta=True))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'daily', 's47813', '610_LT.bin')))
+
+    def test_extend_both_ways(self):
+        self.store.append('daily', STATIONS, JmaIrradiationResponse(CSV_DATA))
+        later = CSV_DATA.replace('2021年1月3日', '2021年1月8日').replace('2021年1月4日', '2021年1月9日') \
+                        .replace('2021年1月5日', '2021年1月10日')
+        earlier = CSV_DATA.replace('2021年1月', '2020年12月')
+        self.store.append('daily', STATIONS, JmaIrradiationResponse(later))
+        self.store.append('daily', STATIONS, JmaIrradiationResponse(earlier))
+        window = self.store.read(JmaStation.Fukuoka, 'daily', date(2020, 1, 1), date(2021, 12, 31))
+        self.assertEqual(datetime(2020, 12, 3), window.start)
+        self.assertEqual(39, len(window.values))
+        self.assertEqual(2.53, window.values[0])
+        self.assertTrue(math.isnan(window.values[3]))
+        self.assertEqual(1.07, window.values[-2])
+
+    def test_replace_values(self):
+        self.store.append('daily', STATIONS, JmaIrradiationResponse(CSV_DATA))
+        before = self.store.read(JmaStation.Fukuoka, 'daily', date(2021, 1, 3), date(2021, 1, 5))
+        self.store.append('daily', STATIONS, JmaIrradiationResponse(CSV_DATA.replace('1.07', '1.5')))
+        after = self.store.read(JmaStation.Fukuoka, 'daily', date(2021, 1, 3), date(2021, 1, 5))
+        self.assertEqual([2.53, 1.5, 11.01], list(after.values))
+        self.assertEqual(1.5, before.values[1]) # views share the mapped file
+
+    def test_hourly_float32(self):
+        csv_data = '''ダウンロードした時刻：2021/03/24 21:40:23
+
+,青森
+,日射量(MJ/㎡)
+2021年3月22日23時,0.5
+2021年3月22日24時,0.25
+2021年3月23日1時,0.125
+'''
+        with SeriesStore(self.tmp.name, dtype='f') as store:
+            store.append('hourly', [JmaStation.Aomori], JmaHourlyIrradiationResponse(csv_data, columnar=True))
+            window = store.read(JmaStation.Aomori, 'hourly', date(2021, 3, 23), date(2021, 3, 23))
+        self.assertEqual('f', window.values.format)
+        self.assertEqual(datetime(2021, 3, 23), window.start)
+        self.assertEqual([0.125], list(window.values))
+
+    def test_missing_series(self):
+        window = self.store.read(JmaStation.Oita, 'daily', date(2021, 1, 1), date(2021, 1, 5))
+        self.assertIsNone(window.start)
+        self.assertEqual(0, len(window.values))
+
+    def test_rejects_kwh(self):
+        with self.assertRaises(ValueError):
+            self.store.append('daily', STATIONS, JmaIrradiationResponse(CSV_DATA, kwh=True))
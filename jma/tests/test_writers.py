@@ -0,0 +1,90 @@
+"""Test cases for the file writers"""
+import csv
+import math
+import os
+import tempfile
+import unittest
+
+from jma.response import JmaIrradiationResponse, JmaHourlyIrradiationResponse
+from jma.writers import CsvWriter, ArrowIpcWriter, write_responses
+
+CSV_DATA = '''ダウンロードした時刻：2021/01/10 15:53:37
+
+,福岡,佐賀
+,合計全天日射量(MJ/㎡),合計全天日射量(MJ/㎡)
+2021年1月1日,2.53,6.95
+2021年1月2日,1.07,
+2021年1月3日,11.01,11.68
+'''
+
+CSV_LATER = CSV_DATA.replace('2021年1月', '2021年2月')
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_csv(self):
+        with CsvWriter(self.path('out.csv'), row_group_size=2) as w:
+            w.write(JmaIrradiationResponse(CSV_DATA))
+            w.write(JmaIrradiationResponse.stream([CSV_LATER.encode('cp932')], encoding='cp932'))
+        self.assertEqual(6, w.rows_written)
+        with open(self.path('out.csv'), encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(['Date', 'Fukuoka', 'Saga'], rows[0])
+        self.assertEqual(['2021-01-02', '1.07', ''], rows[2])
+        self.assertEqual(['2021-02-03', '11.01', '11.68'], rows[-1])
+
+    def test_mismatched_headers(self):
+        other = JmaHourlyIrradiationResponse('''ダウンロードした時刻：2021/03/24 21:40:23
+
+,青森
+,日射量(MJ/㎡)
+2021年3月22日1時,0.08
+''')
+        with CsvWriter(self.path('out.csv')) as w:
+            w.write(JmaIrradiationResponse(CSV_DATA))
+            with self.assertRaises(ValueError):
+                w.write(other)
+
+    def test_open_error(self):
+        w = CsvWriter(self.path('missing/out.csv'))
+        with self.assertRaises(FileNotFoundError):
+            with w:
+                w.write(JmaIrradiationResponse(CSV_DATA))
+        self.assertIsNone(w.headers)
+
+    def test_parquet_row_groups(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        responses = [JmaIrradiationResponse(CSV_DATA), JmaIrradiationResponse(CSV_LATER, columnar=True)]
+        self.assertEqual(6, write_responses(self.path('out.parquet'), responses, row_group_size=2))
+        f = pq.ParquetFile(self.path('out.parquet'))
+        self.assertEqual(4, f.num_row_groups) # each response is split into groups of at most 2 rows
+        table = f.read()
+        self.assertEqual(['Date', 'Fukuoka', 'Saga'], table.column_names)
+        self.assertEqual('2021-02-03 00:00:00', str(table.column('Date')[5]))
+        saga = table.column('Saga').to_pylist()
+        self.assertTrue(math.isnan(saga[1]))
+        self.assertAlmostEqual(11.68, saga[5])
+
+    def test_arrow_ipc(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        with ArrowIpcWriter(self.path('out.arrow'), row_group_size=2) as w:
+            w.write_all([JmaIrradiationResponse(CSV_DATA, date_type='epoch')])
+        with pa.memory_map(self.path('out.arrow')) as source:
+            table = pa.ipc.open_file(source).read_all()
+        expected = JmaIrradiationResponse(CSV_DATA).to_arrow()
+        self.assertTrue(expected.column('Date').equals(table.column('Date')))
+        self.assertEqual([2.53, 1.07, 11.01], table.column('Fukuoka').to_pylist())
@@ -0,0 +1,200 @@
+"""Write responses to disk incrementally.
+
+Every writer accepts any number of responses (including streamed ones) with the same
+headers, and only holds one row group in memory at a time:
+
+    with ParquetWriter('fukuoka.parquet') as w:
+        for result in client.iter_many(queries):
+            w.write(result.response)
+
+CsvWriter has no dependencies. ParquetWriter and ArrowIpcWriter require pyarrow.
+Arrow based formats store Date as a timestamp (JST wall time, seconds) and missing
+values as NaN, like JmaIrradiationResponse.to_arrow.
+"""
+import csv
+import os
+
+ROW_GROUP_SIZE = 64 * 1024 # rows
+
+
+class ResponseWriter():
+    """Base class of the writers. Subclasses implement _open, _write_rows and _close."""
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        """
+        Args:
+            path (str) - Output file. It is created when the first response is written.
+            row_group_size (int) - Maximum number of rows buffered before they are written out
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self.headers = None
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, a, b, c):
+        self.close()
+
+    def write(self, response):
+        """Append the rows of a response. A streamed response is consumed while it is written.
+        Args:
+            response (JmaIrradiationResponse) - Must have the same headers as the previous responses
+        """
+        self._check_headers(response)
+        group = []
+        for row in response.iter_rows():
+            group.append(row)
+            if len(group) >= self.row_group_size:
+                self._write_rows(response, group)
+                group = []
+        if group:
+            self._write_rows(response, group)
+
+    def _check_headers(self, response):
+        if self.headers is None:
+            self.headers = list(response.headers)
+            try:
+                self._open(response)
+            except BaseException:
+                # close() must not touch a file that failed to open
+                self.headers = None
+                raise
+        elif list(response.headers) != self.headers:
+            raise ValueError(f'Headers {response.headers} do not match {self.headers}')
+
+    def write_all(self, responses):
+        """Write every response of an iterable, e.g. the responses of JmaClient.iter_many"""
+        for response in responses:
+            self.write(response)
+
+    def close(self):
+        if self.headers is not None:
+            self._close()
+
+    def _open(self, response):
+        raise NotImplementedError
+
+    def _write_rows(self, response, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class CsvWriter(ResponseWriter):
+    """UTF-8 CSV with a header row. Missing values are left empty."""
+
+    def _open(self, response):
+        self.f = open(self.path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(self.headers)
+
+    def _write_rows(self, response, rows):
+        headers = self.headers
+        self.writer.writerows([row[hdr] for hdr in headers] for row in rows)
+        self.rows_written += len(rows)
+
+    def _close(self):
+        self.f.close()
+
+
+class _ArrowWriter(ResponseWriter):
+    """Converts row groups to pyarrow Tables. Columnar responses are sliced without copying."""
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f'{type(self).__name__} requires pyarrow: pip install jma-client[arrow]')
+        super().__init__(path, row_group_size)
+
+    def write(self, response):
+        if not response.columnar:
+            return super().write(response)
+        self._check_headers(response)
+        table = response.to_arrow()
+        for offset in range(0, table.num_rows, self.row_group_size):
+            self._write_table(table.slice(offset, self.row_group_size))
+
+    def _open(self, response):
+        # an empty table of the right schema
+        schema = type(response).from_rows(self.headers, [], columnar=True).to_arrow().schema
+        self._open_schema(schema)
+
+    def _write_rows(self, response, rows):
+        group = type(response).from_rows(self.headers, rows, columnar=True, date_type=response.date_type)
+        self._write_table(group.to_arrow())
+
+    def _write_table(self, table):
+        self.writer.write_table(table)
+        self.rows_written += table.num_rows
+
+    def _close(self):
+        self.writer.close()
+
+
+class ParquetWriter(_ArrowWriter):
+    """Parquet file with one row group per group of at most row_group_size rows.
+    Parquet has no second resolution timestamps, so Date is stored in milliseconds."""
+
+    def _open_schema(self, schema):
+        import pyarrow.parquet as pq
+        self.writer = pq.ParquetWriter(self.path, schema)
+
+    def _write_table(self, table):
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += table.num_rows
+
+
+class ArrowIpcWriter(_ArrowWriter):
+    """Arrow IPC file (Feather v2) with one record batch per group of at most row_group_size rows"""
+
+    def _open_schema(self, schema):
+        import pyarrow as pa
+        self.writer = pa.ipc.new_file(self.path, schema)
+
+
+# File extension -> writer class
+WRITERS = {
+    '.csv': CsvWriter,
+    '.parquet': ParquetWriter,
+    '.arrow': ArrowIpcWriter,
+    '.feather': ArrowIpcWriter,
+}
+
+# Format name -> file extension
+FORMATS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+
+def writer_for(path, row_group_size=ROW_GROUP_SIZE):
+    """
+    Args:
+        path (str) - Output file. Its extension selects the format: .csv, .parquet, .arrow or .feather
+        row_group_size (int) - Maximum number of rows buffered before they are written out
+    Returns:
+        ResponseWriter
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f'Unknown file extension: {ext}')
+    return WRITERS[ext](path, row_group_size)
+
+
+def write_responses(path, responses, row_group_size=ROW_GROUP_SIZE):
+    """Write responses to a single file, in a format chosen by the file extension (see writer_for).
+    Args:
+        path (str) - Output file
+        responses (Iterable[JmaIrradiationResponse]) - Responses with identical headers
+        row_group_size (int) - Maximum number of rows buffered before they are written out
+    Returns:
+        int - Number of rows written
+    """
+    with writer_for(path, row_group_size) as w:
+        w.write_all(responses)
+    return w.rows_written